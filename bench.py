@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+# time the lexer, parser and translator separately over the example and
+# test scripts and over synthetic scripts of growing size, reporting
+# throughput and peak memory and writing the results as JSON
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import sheepy
+
+stages = ["lex", "parse", "passes", "translate"]
+
+# statements synthetic scripts are made of, {n} being the statement number
+synthetic_lines = [
+    "x{n}=hello",
+    "echo $x{n} $1 world",
+    "# comment {n}\n",
+    "i{n}=$((i{n} + {n}))",
+    "if test -f file{n}.txt\nthen\n    echo found {n}\nelse\n    echo missing\nfi",
+    "for f in a b c{n}\ndo\n    echo $f\ndone",
+    "while test $i = {n}\ndo\n    i=`expr $i + 1`\ndone",
+    "while read line\ndo\n    echo $line\ndone < input{n}.txt",
+    "ls -l *.c | wc -l",
+    "cat f{n}.txt >> log.txt",
+    "name=$(basename /a/b/c{n})",
+    "sleep 1 &",
+]
+
+# a script of n statements drawn from synthetic_lines, the same for the
+# same n
+def synthetic_script(n: int) -> str:
+    rand = random.Random(n)
+    return "#!/bin/dash\n" + "\n".join(rand.choice(synthetic_lines).format(n=i)
+                                       for i in range(n)) + "\n"
+
+# one run of every stage: (seconds by stage, tokens, nodes, output)
+def run_stages(source: str, opt_level: int, lexer: str) -> tuple[dict, int, int, str]:
+    seconds = {}
+    start = time.perf_counter()
+    token = sheepy.Lexer(source, lexer).tokenize()
+    seconds["lex"] = time.perf_counter() - start
+    start = time.perf_counter()
+    stmt = sheepy.Parser(token).parse()
+    seconds["parse"] = time.perf_counter() - start
+    nodes = sum(1 for exp in sheepy.walk(stmt))
+    start = time.perf_counter()
+    stmt = sheepy.PassManager(opt_level).run(stmt)
+    seconds["passes"] = time.perf_counter() - start
+    start = time.perf_counter()
+    code = sheepy.Translator(stmt).translate()
+    seconds["translate"] = time.perf_counter() - start
+    return (seconds, len(token), nodes, code)
+
+# peak memory allocated during each stage, from a separate traced run
+def peak_memory(source: str, opt_level: int, lexer: str) -> dict:
+    peaks = {}
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        token = sheepy.Lexer(source, lexer).tokenize()
+        peaks["lex"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        stmt = sheepy.Parser(token).parse()
+        peaks["parse"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        stmt = sheepy.PassManager(opt_level).run(stmt)
+        peaks["passes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        sheepy.Translator(stmt).translate()
+        peaks["translate"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+# the fastest of repeat runs of each stage
+def bench(name: str, source: str, repeat: int, opt_level: int, lexer: str) -> dict:
+    best = None
+    for _ in range(repeat):
+        seconds, ntoken, nodes, code = run_stages(source, opt_level, lexer)
+        if best == None:
+            best = seconds
+        else:
+            best = {s: min(best[s], seconds[s]) for s in stages}
+    peaks = peak_memory(source, opt_level, lexer)
+    return {
+        "file": name,
+        "bytes": len(source.encode()),
+        "tokens": ntoken,
+        "nodes": nodes,
+        "stages": {s: {"seconds": best[s], "peak_bytes": peaks[s]} for s in stages},
+    }
+
+def rate(count: int, seconds: float) -> float:
+    return count / max(seconds, 1e-9)
+
+def total(results: list[dict]) -> dict:
+    ntoken = sum(r["tokens"] for r in results)
+    nodes = sum(r["nodes"] for r in results)
+    seconds = {s: sum(r["stages"][s]["seconds"] for r in results) for s in stages}
+    return {
+        "files": len(results),
+        "tokens": ntoken,
+        "nodes": nodes,
+        "seconds": seconds,
+        "lex_tokens_per_s": rate(ntoken, seconds["lex"]),
+        "parse_nodes_per_s": rate(nodes, seconds["parse"]),
+        "translate_nodes_per_s": rate(nodes, seconds["translate"]),
+        "tokens_per_s": rate(ntoken, sum(seconds.values())),
+        "peak_bytes": max((r["stages"][s]["peak_bytes"] for r in results for s in stages),
+                          default=0),
+    }
+
+def print_table(results: list[dict], out) -> None:
+    print(f"{'file':<32} {'tokens':>7} {'nodes':>6} {'lex ms':>8} {'parse ms':>9} "
+          f"{'pass ms':>8} {'trans ms':>9} {'tok/s':>10} {'peak KiB':>9}", file=out)
+    for r in results:
+        ms = {s: r["stages"][s]["seconds"] * 1000 for s in stages}
+        peak = max(r["stages"][s]["peak_bytes"] for s in stages)
+        tps = rate(r["tokens"], sum(ms.values()) / 1000)
+        print(f"{r['file']:<32} {r['tokens']:>7} {r['nodes']:>6} {ms['lex']:>8.3f} "
+              f"{ms['parse']:>9.3f} {ms['passes']:>8.3f} {ms['translate']:>9.3f} "
+              f"{tps:>10.0f} {peak / 1024:>9.1f}", file=out)
+
+# differences in the time of each stage against an earlier results file,
+# over the scripts both timed, returning whether any stage got slower by
+# more than threshold percent
+def compare(old: dict, new: dict, threshold: float, out) -> bool:
+    regressed = False
+    for group in ("corpus", "synthetic"):
+        before = {r["file"]: r for r in old.get(group, {}).get("files", [])}
+        common = [r for r in new[group]["files"] if r["file"] in before]
+        if len(common) == 0:
+            continue
+        for s in stages:
+            t0 = sum(before[r["file"]]["stages"][s]["seconds"] for r in common)
+            t1 = sum(r["stages"][s]["seconds"] for r in common)
+            change = (t1 - t0) / max(t0, 1e-9) * 100
+            slower = change > threshold
+            regressed |= slower
+            print(f"{group} {s}: {t0 * 1000:.3f} ms -> {t1 * 1000:.3f} ms "
+                  f"({change:+.1f}%){' SLOWER' if slower else ''}", file=out)
+    return regressed
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(prog="bench.py")
+    ap.add_argument("file", metavar="FILE", nargs="*",
+                    help="scripts to time instead of examples/*/*.sh and test/*.sh")
+    ap.add_argument("--repeat", type=int, default=5,
+                    help="runs of each script, of which the fastest counts")
+    ap.add_argument("--sizes", default="100,1000,10000",
+                    help="statement counts of the synthetic scripts, comma "
+                         "separated, or empty for none")
+    ap.add_argument("-O", dest="opt_level", metavar="LEVEL", type=int,
+                    choices=range(3), default=0, help="optimisation level")
+    ap.add_argument("--lexer", choices=sheepy.lexer_engines, default="cursor")
+    ap.add_argument("--json", metavar="FILE", default="bench.json",
+                    help="where to write the results")
+    ap.add_argument("--compare", metavar="OLD",
+                    help="compare stage times with an earlier results file")
+    ap.add_argument("--threshold", metavar="PERCENT", type=float, default=10,
+                    help="slowdown --compare fails on")
+    args = ap.parse_args(argv)
+    here = os.path.dirname(os.path.abspath(__file__))
+    files = args.file or sorted(glob.glob(os.path.join(here, "examples", "*", "*.sh"))) \
+        + sorted(glob.glob(os.path.join(here, "test", "*.sh")))
+    repeat = max(1, args.repeat)
+    corpus = []
+    for path in files:
+        with open(path) as f:
+            source = f.read()
+        name = os.path.relpath(path, here) if not args.file else path
+        corpus.append(bench(name, source, repeat, args.opt_level, args.lexer))
+    synthetic = []
+    for n in [int(n) for n in args.sizes.split(",") if n.strip()]:
+        synthetic.append(bench(f"synthetic/{n}", synthetic_script(n), repeat,
+                               args.opt_level, args.lexer))
+    results = {
+        "sheepy": sheepy.__version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "repeat": repeat,
+        "opt_level": args.opt_level,
+        "lexer": args.lexer,
+        "corpus": {"files": corpus, "total": total(corpus)},
+        "synthetic": {"files": synthetic, "total": total(synthetic)},
+    }
+    print_table(corpus + synthetic, sys.stdout)
+    for group in ("corpus", "synthetic"):
+        t = results[group]["total"]
+        if t["files"] == 0:
+            continue
+        print(f"{group}: {t['files']} files, {t['tokens']} tokens, "
+              f"lex {t['lex_tokens_per_s']:.0f} tokens/s, "
+              f"parse {t['parse_nodes_per_s']:.0f} nodes/s, "
+              f"translate {t['translate_nodes_per_s']:.0f} nodes/s, "
+              f"overall {t['tokens_per_s']:.0f} tokens/s, "
+              f"peak {t['peak_bytes'] / 1024:.1f} KiB")
+    with open(args.json, "w") as f:
+        json.dump(results, f, indent=1)
+        f.write("\n")
+    if args.compare != None:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, results, args.threshold, sys.stdout):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
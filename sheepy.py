@@ -1,24 +1,102 @@
 #!/usr/bin/python3 -u
+import argparse
+import codecs
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import io
+import itertools
+import json
+import marshal
+import mmap
+import operator
 import os
+import py_compile
 import sys
 import re
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import zipfile
+from array import array
+from types import CodeType
+from typing import Iterator
+
+# the wire format and the client, from next to this file when that is not
+# on the path
+try:
+    import sheepy_client
+except ModuleNotFoundError:
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(
+        "sheepy_client", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sheepy_client.py"))
+    sheepy_client = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sheepy_client)
+    sys.modules["sheepy_client"] = sheepy_client
+from sheepy_client import recv_frame, run_client, send_frame
+
+__version__ = "0.2.0"
 
 t_SHEBANG = r'#!/bin/dash\n'
 t_COMMENT = r'(#.*)\n'
 t_SQUOTE = r'\'([^\']*)\''
 t_DQUOTE = r'"([^"]*)"'
 t_NEWLINE = r'\n'
-t_ASSIGN = r'(\w+)=(\S+)'
+# backquoted commands and $(( )) keep their blanks inside a word
+t_GROUP = r'`[^`]*`|\$\(\((?:[^()]|\([^()]*\))*\)\)|\$\((?:[^()]|\([^()]*\))*\)'
+t_ASSIGN = r'(\w+)=((?:' + t_GROUP + r'|[^\s<>|&])+)'
+t_REDIRECT = r'[12]?>&[12]|[12]?>>|[12]?>|<'
+t_ANDOR = r'&&|\|\|'
+t_PIPE = r'\|'
+t_AMP = r'&'
 t_VAR = r'\$(\w+)'
 t_VARCURLY = r'\${(\w+)}'
-t_WORD = r'(\S+)'
+t_WORD = r'((?:' + t_GROUP + r'|[^\s<>|&])+)'
 t_EMPTY = r'\s+'
 
+# token rules in the order Lexer tries them, joined into one alternation
+# so that a single match at the cursor picks the same rule as the chain
+t_RULES = [
+    ("COMMENT", t_COMMENT),
+    ("SQUOTE", t_SQUOTE),
+    ("DQUOTE", t_DQUOTE),
+    ("NEWLINE", t_NEWLINE),
+    ("REDIRECT", t_REDIRECT),
+    ("ANDOR", t_ANDOR),
+    ("PIPE", t_PIPE),
+    ("AMP", t_AMP),
+    ("ASSIGN", t_ASSIGN),
+    ("WORD", t_WORD),
+    ("EMPTY", t_EMPTY),
+]
+p_SHEBANG = re.compile(t_SHEBANG)
+p_GROUP = re.compile(t_GROUP)
+p_TOKEN = re.compile("|".join(f"(?P<{name}>{pat})" for name, pat in t_RULES))
+
+lexer_engines = ["cursor", "legacy"]
+
+# characters that open a token which only ends at the given character
+stream_closers = {"#": "\n", "'": "'", '"': '"'}
+
 test_str_empty_operators = ["-z", "-n"]
 test_str_cmp_operators = ["=", "!="]
+test_int_cmp_operators = ["-eq", "-ne", "-gt", "-ge", "-lt", "-le"]
 test_file_access_operators = ["-r", "-w", "-x"]
 test_file_type_operators = ["-e", "-f", "-d"]
 
+block_terminators = {"done", "elif", "else", "fi"}
+
+# commands that only read the files they are given
+reader_commands = {"cat", "cmp", "diff", "fgrep", "egrep", "grep", "head", "ls", "sort",
+                   "stat", "tail", "test", "[", "uniq", "wc"}
+
+int_cmp_operators = {"-eq": "==", "-ne": "!=", "-gt": ">", "-ge": ">=", "-lt": "<", "-le": "<="}
+int_cmp_functions = {"-eq": operator.eq, "-ne": operator.ne, "-gt": operator.gt,
+                     "-ge": operator.ge, "-lt": operator.lt, "-le": operator.le}
+
 def eprint(*args, **kwargs) -> None:
     #print(*args, file=sys.stderr, **kwargs)
     pass
@@ -27,18 +105,34 @@ def eeprint(*args, **kwargs) -> None:
     print(*args, file=sys.stderr, **kwargs)
     pass
 
+# a lone [ or ] is no bracket expression, so [ and ] of test stay words
 def is_glob_str(s: str) -> bool:
-    if '*' in s or '?' in s or '[' in s or ']' in s:
+    if '*' in s or '?' in s or re.search(r'\[.+\]', s):
         return True
     return False
 
+# tokens are slotted spans into the source text: src[start:end] is the
+# token as written, and every other field is sliced from it on demand
 class Token:
-    pass
+    __slots__ = ("src", "start", "end")
+
+    def __init__(self, src: str, start: int = 0, end: int = None) -> None:
+        self.src = src
+        self.start = start
+        self.end = len(src) if end == None else end
+
+    # 1-based line and column of the token within src
+    def line_col(self) -> tuple[int, int]:
+        line = self.src.count("\n", 0, self.start) + 1
+        col = self.start - self.src.rfind("\n", 0, self.start)
+        return (line, col)
 
 class Word(Token):
-    def __init__(self, str: str) -> None:
-        super().__init__()
-        self.str = str
+    __slots__ = ()
+
+    @property
+    def str(self) -> str:
+        return self.src[self.start:self.end]
     
     def is_word(obj: object) -> bool:
         return isinstance(obj, Word)
@@ -46,51 +140,98 @@ class Word(Token):
     def is_word_with(obj: object, str: str) -> bool:
         if not Word.is_word(obj):
             return False
-        elif obj.str == str:
+        elif obj.end - obj.start != len(str):
+            return False
+        elif obj.src.startswith(str, obj.start):
             return True
         return False
 
 class Comment(Token):
-    def __init__(self, content: str) -> None:
-        super().__init__()
-        self.content = content
+    __slots__ = ()
+
+    @property
+    def content(self) -> str:
+        return self.src[self.start:self.end]
     
     def is_comment(obj: object) -> bool:
         return isinstance(obj, Comment)
 
 class SQuote(Word):
-    def __init__(self, str: str, content: str) -> None:
-        super().__init__(str)
-        self.content = content
+    __slots__ = ()
+
+    @property
+    def content(self) -> str:
+        return self.src[self.start+1:self.end-1]
 
     def is_squote(obj: object) -> bool:
         return isinstance(obj, SQuote)
 
 class DQuote(Word):
-    def __init__(self, str: str, content: str) -> None:
-        super().__init__(str)
-        self.content = content
+    __slots__ = ()
+
+    @property
+    def content(self) -> str:
+        return self.src[self.start+1:self.end-1]
 
     def is_dquote(obj: object) -> bool:
         return isinstance(obj, DQuote)
 
 class Newline(Token):
-    def __init__(self) -> None:
-        super().__init__()
+    __slots__ = ()
 
     def is_newline(obj: object) -> bool:
         return isinstance(obj, Newline)
 
+class Redirect(Token):
+    __slots__ = ()
+
+    @property
+    def op(self) -> str:
+        return self.src[self.start:self.end]
+
+    def is_redirect(obj: object) -> bool:
+        return isinstance(obj, Redirect)
+
+class Pipe(Token):
+    __slots__ = ()
+
+    def is_pipe(obj: object) -> bool:
+        return isinstance(obj, Pipe)
+
+class Amp(Token):
+    __slots__ = ()
+
+    def is_amp(obj: object) -> bool:
+        return isinstance(obj, Amp)
+
+# && or ||, joining commands into an and-or list
+class AndOr(Token):
+    __slots__ = ()
+
+    @property
+    def op(self) -> str:
+        return self.src[self.start:self.end]
+
+    def is_and_or(obj: object) -> bool:
+        return isinstance(obj, AndOr)
+
 class Assign(Word):
-    def __init__(self, str: str, name: str, value: str) -> None:
-        super().__init__(str)
-        self.name = name
-        self.value = value
+    __slots__ = ()
+
+    @property
+    def name(self) -> str:
+        return self.src[self.start:self.src.index("=", self.start)]
+
+    @property
+    def value(self) -> str:
+        return self.src[self.src.index("=", self.start)+1:self.end]
     
     def is_assign(obj: object) -> bool:
         return isinstance(obj, Assign)
 
 class Var(Word):
+    __slots__ = ("name",)
+
     def __init__(self, str: str, name: str) -> None:
         super().__init__(str)
         self.name = name
@@ -98,12 +239,204 @@ class Var(Word):
     def is_var(obj: object) -> bool:
         return isinstance(obj, Var)
 
+# the string a word stands for when it has no expansion in it
+def literal_word(word: Word) -> str:
+    if SQuote.is_squote(word):
+        return word.content
+    if Var.is_var(word):
+        return None
+    if DQuote.is_dquote(word):
+        s = word.content
+    else:
+        s = word.str
+        if is_glob_str(s) or "'" in s or '"' in s:
+            return None
+    if '$' in s or '`' in s or '\\' in s:
+        return None
+    return s
+
+# split a command's arguments into the set of option letters and the
+# operands, None when an option is not one of allowed; options are literal
+# words before the first operand, and a later one cannot be told apart
+def parse_flags(args: list[Word], allowed: str) -> tuple[set[str], list[Word]]:
+    flags = set()
+    for i, word in enumerate(args):
+        arg = literal_word(word)
+        if arg == "--":
+            operands = args[i+1:]
+            break
+        if arg == None or not arg.startswith("-") or arg == "-":
+            operands = args[i:]
+            break
+        if any(c not in allowed for c in arg[1:]):
+            return None
+        flags.update(arg[1:])
+    else:
+        operands = []
+    if any((literal_word(w) or "").startswith("-") and literal_word(w) != "-" for w in operands):
+        return None
+    return (flags, operands)
+
+printf_escapes = {"\\": "\\", "a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r",
+                  "t": "\t", "v": "\v"}
+
+# backslash escapes of a printf format, None for \c and octal escapes
+# outside ASCII, which are not text
+def printf_unescape(s: str) -> str:
+    if re.search(r'\\(c|[4-7][0-7]{2})', s):
+        return None
+    def escape(m: re.Match) -> str:
+        if m.group(1) != None:
+            return chr(int(m.group(1), 8))
+        return printf_escapes.get(m.group(2), m.group(0))
+    return re.sub(r'\\(?:([0-7]{1,3})|(.))', escape, s)
+
+# token kinds of the master pattern, EMPTY produces no token
+token_kinds = {
+    "COMMENT": Comment,
+    "SQUOTE": SQuote,
+    "DQUOTE": DQuote,
+    "NEWLINE": Newline,
+    "REDIRECT": Redirect,
+    "ANDOR": AndOr,
+    "PIPE": Pipe,
+    "AMP": Amp,
+    "ASSIGN": Assign,
+    "WORD": Word,
+}
+token_classes = (Comment, SQuote, DQuote, Newline, Assign, Word, Redirect, Pipe, Amp, AndOr)
+
+# list-like token sequence stored as parallel columns of kind and span
+# offsets into one source string; tokens are materialized on indexing
+class TokenStore:
+    def __init__(self, src: str) -> None:
+        self.src = src
+        self.kind = array("B")
+        self.start = array("L")
+        self.end = array("L")
+        # the parser looks at the same token several times in a row
+        self.last_i = -1
+        self.last_t = None
+
+    def add(self, cls: type, start: int, end: int) -> None:
+        self.kind.append(token_classes.index(cls))
+        self.start.append(start)
+        self.end.append(end)
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    def __getitem__(self, i: int) -> Token:
+        if i == self.last_i:
+            return self.last_t
+        t = token_classes[self.kind[i]](self.src, self.start[i], self.end[i])
+        self.last_i = i
+        self.last_t = t
+        return t
+
 class Lexer:
-    def __init__(self, input: str) -> None:
+    def __init__(self, input: str, engine: str = "cursor") -> None:
         self.input: str = input
         self.token: list[Token] = []
-    
+        self.engine = engine
+
     def tokenize(self) -> list[Token]:
+        if self.engine == "legacy":
+            return self.tokenize_legacy()
+        return self.tokenize_cursor()
+
+    # one anchored match of the master pattern per token, no slicing
+    def tokenize_cursor(self) -> TokenStore:
+        input = self.input
+        token = self.token = TokenStore(input)
+        end = len(input)
+        pos = 0
+        m = p_SHEBANG.match(input)
+        if m != None:
+            pos = m.end()
+        while pos < end:
+            m = p_TOKEN.match(input, pos)
+            if m == None: # failed
+                eprint("failed")
+                return None
+            kind = m.lastgroup
+            pos = m.end()
+            if kind == "COMMENT":
+                token.add(Comment, m.start(), pos-1)
+                token.add(Newline, pos-1, pos)
+            elif kind != "EMPTY":
+                token.add(token_kinds[kind], m.start(), pos)
+        eprint("lex done")
+        return token
+
+    def append_tokens(m: re.Match, token: list[Token]) -> None:
+        kind = m.lastgroup
+        src = m.string
+        start, end = m.span()
+        if kind == "COMMENT":
+            token.append(Comment(src, start, end-1))
+            token.append(Newline(src, end-1, end))
+        elif kind != "EMPTY":
+            token.append(token_kinds[kind](src, start, end))
+
+    # lex a file object or mmap chunk by chunk, yielding each token once
+    # more input can no longer change it; only the unlexed tail of the
+    # current chunk is kept in memory
+    def stream(source, chunk_size: int = 1 << 16) -> Iterator[Token]:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        buf = ""
+        pos = 0
+        eof = False
+        shebang = True
+        pending: list[Token] = []
+        while True:
+            m = None
+            if shebang:
+                if eof or len(buf) >= len(t_SHEBANG) - 1:
+                    if (m := p_SHEBANG.match(buf)) != None:
+                        pos = m.end()
+                    shebang = False
+                    continue
+            elif pos < len(buf):
+                m = p_TOKEN.match(buf, pos)
+                if eof or Lexer.stream_final(buf, pos, m):
+                    Lexer.append_tokens(m, pending)
+                    yield from pending
+                    pending.clear()
+                    pos = m.end()
+                    continue
+            elif eof:
+                eprint("lex done")
+                return
+            chunk = source.read(chunk_size)
+            eof = len(chunk) == 0
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk, eof)
+            buf = buf[pos:] + chunk
+            pos = 0
+
+    # a match is final when it stops before the end of the buffer and,
+    # for quotes and comments, the closing character is already buffered
+    def stream_final(buf: str, pos: int, m: re.Match) -> bool:
+        if m == None or m.end() >= len(buf):
+            return False
+        closer = stream_closers.get(buf[pos])
+        if closer != None and buf.find(closer, pos + 1) == -1:
+            return False
+        # > may still grow into >> or >&2
+        if m.lastgroup == "REDIRECT" and len(buf) - m.end() < 2:
+            return False
+        # a group left open in the word may close in the next chunk
+        text = m.group()
+        if text.count("`") % 2 == 1 and buf.find("`", m.end()) == -1:
+            return False
+        j = -1
+        while (j := text.find("$(", j + 1)) != -1:
+            if p_GROUP.match(buf, pos + j) == None:
+                return False
+        return True
+
+    def tokenize_legacy(self) -> list[Token]:
         self.shebang()
         while True:
             if self.lex_comment():
@@ -114,6 +447,14 @@ class Lexer:
                 continue
             elif self.lex_newline():
                 continue
+            elif self.lex_redirect():
+                continue
+            elif self.lex_and_or():
+                continue
+            elif self.lex_pipe():
+                continue
+            elif self.lex_amp():
+                continue
             elif self.lex_assign():
                 continue
             #elif self.lex_var():
@@ -143,7 +484,7 @@ class Lexer:
             return False
         elif m.span()[0] == 0:
             self.token.append(Comment(m.group(1)))
-            self.token.append(Newline())
+            self.token.append(Newline("\n"))
             self.cut(m.span())
             return True
         return False
@@ -153,7 +494,7 @@ class Lexer:
         if m == None:
             return False
         elif m.span()[0] == 0:
-            self.token.append(SQuote(m.group(0), m.group(1)))
+            self.token.append(SQuote(m.group(0)))
             self.cut(m.span())
             return True
         return False
@@ -163,7 +504,7 @@ class Lexer:
         if m == None:
             return False
         elif m.span()[0] == 0:
-            self.token.append(DQuote(m.group(0), m.group(1)))
+            self.token.append(DQuote(m.group(0)))
             self.cut(m.span())
             return True
         return False
@@ -173,7 +514,47 @@ class Lexer:
         if m == None:
             return False
         elif m.span()[0] == 0:
-            self.token.append(Newline())
+            self.token.append(Newline(m.group(0)))
+            self.cut(m.span())
+            return True
+        return False
+
+    def lex_redirect(self) -> bool:
+        m = re.search(t_REDIRECT, self.input)
+        if m == None:
+            return False
+        elif m.span()[0] == 0:
+            self.token.append(Redirect(m.group(0)))
+            self.cut(m.span())
+            return True
+        return False
+
+    def lex_and_or(self) -> bool:
+        m = re.search(t_ANDOR, self.input)
+        if m == None:
+            return False
+        elif m.span()[0] == 0:
+            self.token.append(AndOr(m.group(0)))
+            self.cut(m.span())
+            return True
+        return False
+
+    def lex_pipe(self) -> bool:
+        m = re.search(t_PIPE, self.input)
+        if m == None:
+            return False
+        elif m.span()[0] == 0:
+            self.token.append(Pipe(m.group(0)))
+            self.cut(m.span())
+            return True
+        return False
+
+    def lex_amp(self) -> bool:
+        m = re.search(t_AMP, self.input)
+        if m == None:
+            return False
+        elif m.span()[0] == 0:
+            self.token.append(Amp(m.group(0)))
             self.cut(m.span())
             return True
         return False
@@ -183,7 +564,7 @@ class Lexer:
         if m == None:
             return False
         elif m.span()[0] == 0:
-            self.token.append(Assign(m.group(0), m.group(1), m.group(2)))
+            self.token.append(Assign(m.group(0)))
             self.cut(m.span())
             return True
         return False
@@ -233,6 +614,22 @@ class Lexer:
     def cut(self, span: tuple[int, int]) -> None:
         self.input = self.input[span[1]:]
 
+    def token_key(t: Token) -> tuple:
+        fields = ("str", "content", "name", "value", "op")
+        return (type(t).__name__,) + tuple(getattr(t, f, None) for f in fields)
+
+    # run both engines over input, return index of first differing token
+    # or -1 if the token streams are identical
+    def compare(input: str) -> int:
+        cursor = Lexer(input, "cursor").tokenize() or []
+        legacy = Lexer(input, "legacy").tokenize() or []
+        for i in range(max(len(cursor), len(legacy))):
+            if i >= len(cursor) or i >= len(legacy):
+                return i
+            if Lexer.token_key(cursor[i]) != Lexer.token_key(legacy[i]):
+                return i
+        return -1
+
 class Typ:
     pass
 
@@ -244,6 +641,10 @@ class ListTyp(Typ):
     def is_list_typ(obj: object) -> bool:
         return isinstance(obj, ListTyp)
 
+class IntTyp(Typ):
+    def is_int_typ(obj: object) -> bool:
+        return isinstance(obj, IntTyp)
+
 class Exp:
     pass
 
@@ -287,6 +688,60 @@ class FormatExp(Exp):
     def is_format_exp(obj: object) -> bool:
         return isinstance(obj, FormatExp)
 
+# integer arithmetic of expr and $(( ))
+class ArithExp(Exp):
+    def is_arith_exp(obj: object) -> bool:
+        return isinstance(obj, ArithExp)
+
+class ArithNumExp(ArithExp):
+    def __init__(self, value: int) -> None:
+        super().__init__()
+        self.value = value
+
+class ArithVarExp(ArithExp):
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.name = name
+
+class ArithNegExp(ArithExp):
+    def __init__(self, exp: ArithExp) -> None:
+        super().__init__()
+        self.exp = exp
+
+class ArithBinExp(ArithExp):
+    def __init__(self, op: str, lhs: ArithExp, rhs: ArithExp) -> None:
+        super().__init__()
+        self.op = op
+        self.lhs = lhs
+        self.rhs = rhs
+
+# output of a command, trailing newlines removed
+class CmdSubstExp(Exp):
+    def __init__(self, cmd: list[Word]) -> None:
+        super().__init__()
+        self.cmd = cmd
+
+    def is_cmd_subst_exp(obj: object) -> bool:
+        return isinstance(obj, CmdSubstExp)
+
+    # a whole word that is `...` or $(...) running a simple command
+    def parse_word(s: str) -> Exp:
+        m = re.fullmatch(r'`([^`]*)`|\$\((?!\()(.*)\)', s, re.S)
+        if m == None:
+            return None
+        token = Lexer(m.group(1) if m.group(1) != None else m.group(2)).tokenize()
+        if token == None or len(token) == 0:
+            return None
+        cmd = []
+        for i in range(len(token)):
+            t = token[i]
+            if not Word.is_word(t) or Assign.is_assign(t):
+                return None
+            if not SQuote.is_squote(t) and not DQuote.is_dquote(t) and re.search(r'[;&|<>()]', t.str):
+                return None
+            cmd.append(t)
+        return CmdSubstExp(cmd)
+
 class AssignExp(Exp):
     def __init__(self, name: str, value: Exp, typ: Typ) -> None:
         super().__init__()
@@ -322,9 +777,10 @@ class ReadExp(Exp):
         return isinstance(obj, ReadExp)
 
 class EchoExp(Exp):
-    def __init__(self, args: list[Word]) -> None:
+    def __init__(self, args: list[Word], redirects: list[tuple[str, Word]] = []) -> None:
         super().__init__()
         self.args = args
+        self.redirects = redirects
 
     def is_echo_exp(obj: object) -> bool:
         return isinstance(obj, EchoExp)
@@ -383,6 +839,54 @@ class StrCmpTestExp(TestExp):
     def is_str_cmp_test_exp(obj: object) -> bool:
         return isinstance(obj, StrCmpTestExp)
 
+class IntCmpTestExp(TestExp):
+    def __init__(self, op: Word, lhs: Word, rhs: Word) -> None:
+        super().__init__()
+        self.op = op
+        self.lhs = lhs
+        self.rhs = rhs
+
+    def is_int_cmp_test_exp(obj: object) -> bool:
+        return isinstance(obj, IntCmpTestExp)
+
+class NotTestExp(TestExp):
+    def __init__(self, pred: TestExp) -> None:
+        super().__init__()
+        self.pred = pred
+
+    def is_not_test_exp(obj: object) -> bool:
+        return isinstance(obj, NotTestExp)
+
+# -a and -o of test, op is "and" or "or"
+class LogicTestExp(TestExp):
+    def __init__(self, op: str, lhs: TestExp, rhs: TestExp) -> None:
+        super().__init__()
+        self.op = op
+        self.lhs = lhs
+        self.rhs = rhs
+
+    def is_logic_test_exp(obj: object) -> bool:
+        return isinstance(obj, LogicTestExp)
+
+# any other command used as a condition, true on exit status 0
+class CmdTestExp(TestExp):
+    def __init__(self, cmd: list[Word], redirects: list[tuple[str, Word]] = []) -> None:
+        super().__init__()
+        self.cmd = cmd
+        self.redirects = redirects
+
+    def is_cmd_test_exp(obj: object) -> bool:
+        return isinstance(obj, CmdTestExp)
+
+# a condition whose value is known when translating
+class ConstTestExp(TestExp):
+    def __init__(self, value: bool) -> None:
+        super().__init__()
+        self.value = value
+
+    def is_const_test_exp(obj: object) -> bool:
+        return isinstance(obj, ConstTestExp)
+
 class IfExp(Exp):
     def __init__(self, pred: list[TestExp], branch: list[list[object]]) -> None:
         super().__init__()
@@ -393,99 +897,457 @@ class IfExp(Exp):
         return isinstance(obj, IfExp)
 
 class WhileExp(Exp):
-    def __init__(self, pred: TestExp, body: list[object]) -> None:
+    def __init__(self, pred: TestExp, body: list[object],
+                 redirects: list[tuple[str, Word]] = []) -> None:
         super().__init__()
         self.pred = pred
         self.body = body
+        self.redirects = redirects
 
     def is_while_exp(obj: object) -> bool:
         return isinstance(obj, WhileExp)
 
 class CmdExp(Exp):
-    def __init__(self, cmd: list[Word]) -> None:
+    def __init__(self, cmd: list[Word], redirects: list[tuple[str, Word]] = []) -> None:
         super().__init__()
         self.cmd = cmd
+        self.redirects = redirects
 
     def is_cmd_exp(obj: object) -> bool:
         return isinstance(obj, CmdExp)
 
+# commands joined by |, each an EchoExp or CmdExp
+class PipelineExp(Exp):
+    def __init__(self, stages: list[Exp]) -> None:
+        super().__init__()
+        self.stages = stages
+
+    def is_pipeline_exp(obj: object) -> bool:
+        return isinstance(obj, PipelineExp)
+
+# a pipeline as a condition, on the status of its last command
+class PipelineTestExp(TestExp):
+    def __init__(self, pipeline: PipelineExp) -> None:
+        super().__init__()
+        self.pipeline = pipeline
+
+    def is_pipeline_test_exp(obj: object) -> bool:
+        return isinstance(obj, PipelineTestExp)
+
+# a command run in the background with &
+class BackgroundExp(Exp):
+    def __init__(self, cmd: CmdExp) -> None:
+        super().__init__()
+        self.cmd = cmd
+
+    def is_background_exp(obj: object) -> bool:
+        return isinstance(obj, BackgroundExp)
+
+# every node of a statement list, nested blocks and conditions included
+def walk(explist: list[object]) -> Iterator[Exp]:
+    for exp in explist:
+        yield exp
+        if ForExp.is_for_exp(exp):
+            yield from walk(exp.body)
+        elif IfExp.is_if_exp(exp):
+            yield from walk(exp.pred)
+            for branch in exp.branch:
+                yield from walk(branch)
+        elif WhileExp.is_while_exp(exp):
+            yield from walk([exp.pred])
+            yield from walk(exp.body)
+        elif NotTestExp.is_not_test_exp(exp):
+            yield from walk([exp.pred])
+        elif LogicTestExp.is_logic_test_exp(exp):
+            yield from walk([exp.lhs, exp.rhs])
+        elif PipelineExp.is_pipeline_exp(exp):
+            yield from walk(exp.stages)
+        elif PipelineTestExp.is_pipeline_test_exp(exp):
+            yield from walk([exp.pipeline])
+        elif BackgroundExp.is_background_exp(exp):
+            yield from walk([exp.cmd])
+
+# names code refers to an attribute of, such as the modules it uses
+def names_used(code: str) -> set[str]:
+    return set(re.findall(r'\b(\w+)\.', code))
+
+# a sink that keeps only the names written to it; the last line is held
+# back until it ends, as a name may be written in more than one piece
+class NameSink:
+    def __init__(self) -> None:
+        self.names: set[str] = set()
+        self.line = ""
+
+    def write(self, code: str) -> None:
+        code = self.line + code
+        end = code.rfind("\n") + 1
+        self.names |= names_used(code[:end])
+        self.line = code[end:]
+
+    def flush(self) -> None:
+        self.names |= names_used(self.line)
+        self.line = ""
+
+# list-like view over a token iterator, pulling tokens on demand and
+# dropping the ones the parser has released; indices stay absolute
+class TokenStream:
+    def __init__(self, it: Iterator[Token]) -> None:
+        self.it = it
+        self.buf: list[Token] = []
+        self.base = 0
+        self.done = False
+
+    def has(self, i: int) -> bool:
+        while i - self.base >= len(self.buf):
+            if self.done:
+                return False
+            if (t := next(self.it, None)) == None:
+                self.done = True
+                return False
+            self.buf.append(t)
+        return True
+
+    def __getitem__(self, i: int) -> Token:
+        return self.buf[i - self.base]
+
+    def release(self, i: int) -> None:
+        self.has(i - 1) # tokens skipped without being looked at
+        del self.buf[:i - self.base]
+        self.base = i
+
+# recursive descent over the operands and operators of an arithmetic
+# expression, given as strings; None when it is not one we handle
+class Arith:
+    def __init__(self, items: list[str], names: bool) -> None:
+        self.items = items
+        # bare names are variables in $(( )) but strings to expr
+        self.names = names
+        self.pos = 0
+
+    # expr arguments as written inside backquotes, e.g. 7 '*' $n + 3
+    def parse_expr(s: str) -> ArithExp:
+        items = []
+        for m in re.finditer(r"'([^']*)'|\"([^\"$`\\]*)\"|\\(\S)|([^\s'\"\\]+)", s):
+            if m.group(4) != None and is_glob_str(m.group(4)):
+                return None
+            items.append(next(g for g in m.groups() if g != None))
+        if len(s.split()) != len(items):
+            return None
+        return Arith(items, False).parse()
+
+    # the inside of $(( ))
+    def parse_arith(s: str) -> ArithExp:
+        pat = r'\s*(\d+|\$\w+|\$\{\w+\}|\$#|\w+|[-+*/%()])'
+        items = []
+        pos = 0
+        while (m := re.match(pat, s[pos:])) != None:
+            items.append(m.group(1))
+            pos += m.end()
+        if s[pos:].strip() != "":
+            return None
+        return Arith(items, True).parse()
+
+    def parse(self) -> ArithExp:
+        exp = self.parse_sum()
+        if exp == None or self.pos != len(self.items):
+            return None
+        return exp
+
+    def peek(self) -> str:
+        if self.pos < len(self.items):
+            return self.items[self.pos]
+        return None
+
+    def parse_sum(self) -> ArithExp:
+        if (lhs := self.parse_product()) == None:
+            return None
+        while self.peek() in ("+", "-"):
+            op = self.items[self.pos]
+            self.pos += 1
+            if (rhs := self.parse_product()) == None:
+                return None
+            lhs = ArithBinExp(op, lhs, rhs)
+        return lhs
+
+    def parse_product(self) -> ArithExp:
+        if (lhs := self.parse_unary()) == None:
+            return None
+        while self.peek() in ("*", "/", "%"):
+            op = self.items[self.pos]
+            self.pos += 1
+            if (rhs := self.parse_unary()) == None:
+                return None
+            lhs = ArithBinExp(op, lhs, rhs)
+        return lhs
+
+    def parse_unary(self) -> ArithExp:
+        if self.names and self.peek() in ("+", "-"):
+            op = self.items[self.pos]
+            self.pos += 1
+            if (exp := self.parse_unary()) == None:
+                return None
+            return ArithNegExp(exp) if op == "-" else exp
+        return self.parse_atom()
+
+    def parse_atom(self) -> ArithExp:
+        if (item := self.peek()) == None:
+            return None
+        self.pos += 1
+        if item == "(":
+            if (exp := self.parse_sum()) == None or self.peek() != ")":
+                return None
+            self.pos += 1
+            return exp
+        if re.fullmatch(r'-?\d+', item):
+            return ArithNumExp(int(item))
+        if (m := re.fullmatch(r'\$(\w+|#)|\${(\w+)}', item)) != None:
+            return ArithVarExp(m.group(1) or m.group(2))
+        if self.names and re.fullmatch(r'[A-Za-z_]\w*', item):
+            return ArithVarExp(item)
+        return None
+
+    # a whole word that is `expr ...`, $(expr ...) or $(( ... ))
+    def parse_word(s: str) -> ArithExp:
+        if (m := re.fullmatch(r'`\s*expr\s+(.*)`|\$\(\s*expr\s+(.*)\)', s, re.S)) != None:
+            return Arith.parse_expr(m.group(1) if m.group(1) != None else m.group(2))
+        if (m := re.fullmatch(r'\$\(\((.*)\)\)', s, re.S)) != None:
+            return Arith.parse_arith(m.group(1))
+        return None
+
+# a script the parser cannot make sense of
+class ParseError(Exception):
+    pass
+
 class Parser:
-    def __init__(self, token: list[Token]) -> None:
+    def __init__(self, token: list[Token] | TokenStore | Iterator[Token],
+                 memoize: bool = True) -> None:
         super().__init__()
+        if not isinstance(token, (list, TokenStore, TokenStream)):
+            token = TokenStream(token)
         self.token = token
+        self.stream = isinstance(token, TokenStream)
+        self.size = 0 if self.stream else len(token)
         self.pos = 0
+        self.memoize = memoize
+        self.memo: dict[tuple[str, int], tuple] = {}
+        self.memo_hits = 0
+        self.memo_misses = 0
         #self.stmt = []
 
-    def parse(self) -> None:
+    def parse(self) -> list[Exp]:
         stmt = []
-        self.parse_sequence(stmt)
+        if not self.parse_sequence(stmt) or not self.pos_out_of_range():
+            # parse again one statement at a time to find where it fails
+            self.pos = 0
+            return list(self.parse_iter())
         return stmt
-    
+
+    # memo of the backtracking rules on (rule, position): recall replays
+    # what a rule did from here before, and remember stores its result, the
+    # statements it added after the first n and where it stopped. Rules
+    # look themselves up, and the compound commands are looked up where
+    # they are called, rather than through a wrapper that would add frames
+    # to every level of nesting
+    def recall(self, name: str, stmt: list[Exp] = None) -> tuple:
+        if not self.memoize:
+            return None
+        if (hit := self.memo.get((name, self.pos))) == None:
+            self.memo_misses += 1
+            return None
+        self.memo_hits += 1
+        result, items, self.pos = hit
+        if stmt != None:
+            stmt.extend(items)
+        return hit
+
+    def remember(self, name: str, start: int, result, stmt: list[Exp] = None, n: int = 0):
+        if self.memoize:
+            self.memo[(name, start)] = (result, () if stmt == None else stmt[n:], self.pos)
+        return result
+
+    # yield top-level statements one by one, releasing their tokens
+    def parse_iter(self) -> Iterator[Exp]:
+        while not self.pos_out_of_range():
+            stmt = []
+            if self.next_is_terminator() or not self.parse_statement(stmt):
+                raise self.error()
+            yield from stmt
+            if self.stream:
+                self.token.release(self.pos)
+                self.memo.clear()
+        eprint("parse done")
+
     def parse_sequence(self, stmt: list[Exp]) -> bool:
+        if (hit := self.recall("parse_sequence", stmt)) != None:
+            return hit[0]
         bak = (self.pos, stmt)
+        start = self.pos
+        n = len(stmt)
         while True:
-            if self.pos >= len(self.token):
+            # the rest of a sequence only depends on where it starts, so
+            # reuse one already parsed from here
+            if self.pos != start and (hit := self.memo.get(("parse_sequence", self.pos))) != None:
+                self.memo_hits += 1
+                result, items, self.pos = hit
+                stmt.extend(items)
+                if not result:
+                    self.pos, stmt = bak
+                return self.remember("parse_sequence", start, result, stmt, n)
+            if self.pos_out_of_range():
                 eprint("parse done")
-                return True
+                return self.remember("parse_sequence", start, True, stmt, n)
             elif self.next_is_terminator():
                 eprint("block terminate")
-                return True
-            elif self.parse_comment(stmt):
-                eprint("comment")
-                continue
-            elif self.parse_newline(stmt):
-                eprint("newline")
-                continue
-            elif self.parse_assign(stmt):
-                eprint("assign")
-                continue
-            elif self.parse_cd(stmt):
-                eprint("cd")
-                continue
-            elif self.parse_echo(stmt):
-                eprint("echo")
-                continue
-            elif self.parse_read(stmt):
-                eprint("read")
-                continue
-            elif self.parse_exit(stmt):
-                eprint("exit")
-                continue
-            elif self.parse_for(stmt):
-                eprint("for")
-                continue
-            elif self.parse_if(stmt):
-                eprint("if")
-                continue
-            elif self.parse_while(stmt):
-                eprint("while")
-                continue
-            elif self.parse_cmd(stmt):
-                eprint("cmd")
+                return self.remember("parse_sequence", start, True, stmt, n)
+            # parse_statement, with a compound command's rule called from
+            # here so that a level of nesting costs two frames
+            elif (rule := self.command_rule()) in Parser.compound_rules:
+                pos, m = self.pos, len(stmt)
+                if (hit := self.recall(rule.__name__, stmt)) != None:
+                    ok = hit[0]
+                else:
+                    ok = self.remember(rule.__name__, pos, rule(self, stmt), stmt, m)
+                if (ok or self.parse_cmd(stmt)) and self.parse_pipeline(stmt) \
+                        and self.parse_and_or(stmt) and self.parse_background(stmt):
+                    continue
+            elif self.parse_statement(stmt):
                 continue
-            else:
-                eprint("fail")
-                self.pos, stmt = bak
-                return False
-
-    # methods below won't consume token, just detect
+            eprint("fail")
+            self.pos, stmt = bak
+            return self.remember("parse_sequence", start, False, stmt, n)
 
-    def pos_out_of_range(self) -> bool:
-        return self.pos >= len(self.token)
-    
-    def next_is_comment(self) -> bool:
+    # the token the parser stopped at, and its line
+    def error(self) -> ParseError:
         if self.pos_out_of_range():
-            return False
-        if Comment.is_comment(self.token[self.pos]):
-            return True
-        return False
+            return ParseError("syntax error: unexpected end of file")
+        t = self.token[self.pos]
+        line, col = t.line_col()
+        return ParseError(f"line {line}: syntax error near '{t.src[t.start:t.end]}'")
 
-    def next_is_word(self) -> bool:
-        if self.pos_out_of_range():
-            return False
-        if Word.is_word(self.token[self.pos]):
-            return True
-        return False
+    def parse_statement(self, stmt: list[Exp]) -> bool:
+        return self.parse_command(stmt) and self.parse_and_or(stmt) and self.parse_background(stmt)
+
+    # dispatch on the leading token: its type for comments, newlines and
+    # assignments, its word for builtins and compound commands, and
+    # anything else, or a compound that fails to parse, is a command
+    def parse_command(self, stmt: list[Exp]) -> bool:
+        rule = self.command_rule()
+        if rule in Parser.compound_rules:
+            pos, n = self.pos, len(stmt)
+            if (hit := self.recall(rule.__name__, stmt)) != None:
+                ok = hit[0]
+            else:
+                ok = self.remember(rule.__name__, pos, rule(self, stmt), stmt, n)
+        else:
+            ok = rule != None and rule(self, stmt)
+        if ok:
+            eprint(rule.__name__)
+            return self.parse_pipeline(stmt)
+        eprint("parse_cmd")
+        return self.parse_cmd(stmt) and self.parse_pipeline(stmt)
+
+    # the rule of the statement at pos, or None for a command
+    def command_rule(self):
+        if self.pos_out_of_range():
+            return None
+        t = self.token[self.pos]
+        rule = Parser.kind_rules.get(type(t))
+        if rule == None and Word.is_word(t):
+            rule = Parser.keyword_rules.get(t.str)
+        return rule
+
+    # cmd && cmd || cmd: every command but the last is a condition, and
+    # the last runs when the list before it has the status its operator
+    # asks for
+    def parse_and_or(self, stmt: list[Exp]) -> bool:
+        if not self.next_is_and_or():
+            return True
+        if (pred := Parser.as_pred(stmt[-1])) == None:
+            return False
+        while True:
+            op = self.token[self.pos].op
+            self.pos += 1
+            while self.consume_next_newline():
+                pass
+            rest = []
+            if not self.parse_command(rest) or len(rest) != 1:
+                return False
+            if not self.next_is_and_or():
+                break
+            if (rhs := Parser.as_pred(rest[0])) == None:
+                return False
+            pred = LogicTestExp("and" if op == "&&" else "or", pred, rhs)
+        stmt[-1] = IfExp([pred if op == "&&" else NotTestExp(pred)], [rest])
+        return True
+
+    # a command of an and-or list as the condition it is
+    def as_pred(exp: Exp) -> TestExp:
+        if EchoExp.is_echo_exp(exp):
+            return CmdTestExp([Word("echo")] + exp.args, exp.redirects)
+        if CmdExp.is_cmd_exp(exp) and len(exp.cmd) > 0:
+            return CmdTestExp(exp.cmd, exp.redirects)
+        if PipelineExp.is_pipeline_exp(exp):
+            return PipelineTestExp(exp)
+        return None
+
+    # the rest of a pipeline whose first command ends stmt
+    def parse_pipeline(self, stmt: list[Exp]) -> bool:
+        if not self.next_is_pipe():
+            return True
+        first = stmt[-1]
+        if not EchoExp.is_echo_exp(first) and not CmdExp.is_cmd_exp(first):
+            return False
+        stages = [first]
+        while self.consume_next_pipe():
+            # the pipeline goes on after a line break
+            while self.consume_next_newline():
+                pass
+            if not self.parse_stage(stages):
+                return False
+        stmt[-1] = PipelineExp(stages)
+        return True
+
+    # a & ending the line puts the simple command or echo ending stmt in
+    # the background
+    def parse_background(self, stmt: list[Exp]) -> bool:
+        if self.pos_out_of_range() or not Amp.is_amp(self.token[self.pos]):
+            return True
+        if self.token_at(self.pos + 1) and not isinstance(self.token[self.pos + 1], (Newline, Comment)):
+            return False
+        cmd = stmt[-1]
+        if EchoExp.is_echo_exp(cmd):
+            cmd = CmdExp([Word("echo")] + cmd.args, cmd.redirects)
+        if not CmdExp.is_cmd_exp(cmd) or len(cmd.cmd) == 0:
+            return False
+        self.pos += 1
+        stmt[-1] = BackgroundExp(cmd)
+        return True
+
+    def parse_stage(self, stages: list[Exp]) -> bool:
+        if self.next_is_word_with("echo"):
+            return self.parse_echo(stages)
+        return self.parse_cmd(stages)
+
+    # methods below won't consume token, just detect
+
+    def pos_out_of_range(self) -> bool:
+        if self.stream:
+            return not self.token.has(self.pos)
+        return self.pos >= self.size
+    
+    def next_is_comment(self) -> bool:
+        if self.pos_out_of_range():
+            return False
+        if Comment.is_comment(self.token[self.pos]):
+            return True
+        return False
+
+    def next_is_word(self) -> bool:
+        if self.pos_out_of_range():
+            return False
+        if Word.is_word(self.token[self.pos]):
+            return True
+        return False
 
     def next_is_word_with(self, expect: str) -> bool:
         if self.pos_out_of_range():
@@ -508,16 +1370,27 @@ class Parser:
             return True
         return False
 
-    def next_is_terminator(self) -> bool:
+    def next_is_pipe(self) -> bool:
         if self.pos_out_of_range():
             return False
-        if self.next_is_word_with("done"):
-            return True
-        if self.next_is_word_with("elif"):
-            return True
-        if self.next_is_word_with("else"):
+        return Pipe.is_pipe(self.token[self.pos])
+
+    def next_is_and_or(self) -> bool:
+        if self.pos_out_of_range():
+            return False
+        return AndOr.is_and_or(self.token[self.pos])
+
+    def consume_next_pipe(self) -> bool:
+        if self.next_is_pipe():
+            self.pos += 1
             return True
-        if self.next_is_word_with("fi"):
+        return False
+
+    def next_is_terminator(self) -> bool:
+        if self.pos_out_of_range():
+            return False
+        t = self.token[self.pos]
+        if Word.is_word(t) and t.str in block_terminators:
             return True
         return False
 
@@ -537,6 +1410,37 @@ class Parser:
             return word
         return None
 
+    # a redirection operator and its target word, which a duplication
+    # like 2>&1 has none of
+    def consume_next_redirect(self) -> tuple[str, Word]:
+        if self.pos_out_of_range() or not Redirect.is_redirect(self.token[self.pos]):
+            return None
+        op = self.token[self.pos].op
+        if "&" in op:
+            self.pos += 1
+            return (op, None)
+        if (t := self.token[self.pos + 1] if self.token_at(self.pos + 1) else None) == None or not Word.is_word(t):
+            return None
+        self.pos += 2
+        return (op, t)
+
+    def token_at(self, i: int) -> bool:
+        if self.stream:
+            return self.token.has(i)
+        return i < self.size
+
+    # words and redirections of a simple command, in any order
+    def consume_words_redirects(self) -> tuple[list[Word], list[tuple[str, Word]]]:
+        words = []
+        redirects = []
+        while True:
+            if (w := self.consume_next_word()) != None:
+                words.append(w)
+            elif (r := self.consume_next_redirect()) != None:
+                redirects.append(r)
+            else:
+                return (words, redirects)
+
     def consume_next_word_if_is(self, expect: str) -> bool:
         if self.next_is_word_with(expect):
             self.pos += 1
@@ -568,7 +1472,6 @@ class Parser:
         # same as above
         if (c := self.consume_next_comment()) != None:
             stmt.append(CommentExp(c.content))
-            self.pos += 1
             return True
         return False
 
@@ -620,6 +1523,12 @@ class Parser:
         if (t := self.consume_next_assign()) != None:
             value = t.value
             typ = None
+            if (arith := Arith.parse_word(value)) != None:
+                stmt.append(AssignExp(t.name, ListExp([(arith, IntTyp())]), typ))
+                return True
+            if (subst := CmdSubstExp.parse_word(value)) != None:
+                stmt.append(AssignExp(t.name, ListExp([(subst, WordTyp())]), typ))
+                return True
             value_str_list = re.split(' +', value)
             exp_typ_list = list(map(Parser.str_exp_mapper, value_str_list))
             list_exp = ListExp(exp_typ_list)
@@ -655,11 +1564,9 @@ class Parser:
     
     def parse_echo(self, stmt: list[Exp]) -> bool:
         if self.consume_next_word_if_is("echo"):
-            args = []
-            while (next_arg := self.consume_next_word()) != None:
-                args.append(next_arg)
+            args, redirects = self.consume_words_redirects()
             eprint(list(map(lambda w: w.str, args)))
-            stmt.append(EchoExp(args))
+            stmt.append(EchoExp(args, redirects))
             return True
         return False
     
@@ -709,24 +1616,118 @@ class Parser:
         stmt.append(ForExp(var, iter, body))
         return True
 
-    # TODO only implemented eq test in subset 2
+    # conditions joined by && and ||, which bind equally from the left
     def parse_pred(self) -> TestExp:
+        if (hit := self.recall("parse_pred")) != None:
+            return hit[0]
+        start = self.pos
+        if (lhs := self.parse_pred_pipeline()) == None:
+            return self.remember("parse_pred", start, None)
+        while self.next_is_and_or():
+            op = self.token[self.pos].op
+            self.pos += 1
+            while self.consume_next_newline():
+                pass
+            if (rhs := self.parse_pred_pipeline()) == None:
+                return self.remember("parse_pred", start, None)
+            lhs = LogicTestExp("and" if op == "&&" else "or", lhs, rhs)
+        return self.remember("parse_pred", start, lhs)
+
+    def parse_pred_pipeline(self) -> TestExp:
+        bak = self.pos
+        # ! in front of the command negates its status
+        if self.consume_next_word_if_is("!"):
+            if (testexp := self.parse_pred_pipeline()) != None:
+                return NotTestExp(testexp)
+            self.pos = bak
+            return None
+        if (testexp := self.parse_pred_test()) != None:
+            return testexp
+        self.pos = bak
+        return self.parse_pred_cmd()
+
+    def parse_pred_test(self) -> TestExp:
+        bak = self.pos
+        # test keyword, or [ which needs a closing ]
+        closer = None
+        if self.consume_next_word_if_is("["):
+            closer = "]"
+        elif not self.consume_next_word_if_is("test"):
+            return None
+        if (testexp := self.parse_pred_or()) == None:
+            self.pos = bak
+            return None
+        if closer != None and not self.consume_next_word_if_is(closer):
+            self.pos = bak
+            return None
+        # the whole command must be the expression
+        if not self.pos_out_of_range() and not self.next_is_newline() and not self.next_is_and_or():
+            self.pos = bak
+            return None
+        return testexp
+
+    # -o binds loosest, then -a, then !
+    def parse_pred_or(self) -> TestExp:
+        if (lhs := self.parse_pred_and()) == None:
+            return None
+        while self.next_is_word_with("-o"):
+            bak = self.pos
+            self.consume_next_word()
+            if (rhs := self.parse_pred_and()) == None:
+                self.pos = bak
+                return lhs
+            lhs = LogicTestExp("or", lhs, rhs)
+        return lhs
+
+    def parse_pred_and(self) -> TestExp:
+        if (lhs := self.parse_pred_not()) == None:
+            return None
+        while self.next_is_word_with("-a"):
+            bak = self.pos
+            self.consume_next_word()
+            if (rhs := self.parse_pred_not()) == None:
+                self.pos = bak
+                return lhs
+            lhs = LogicTestExp("and", lhs, rhs)
+        return lhs
+
+    def parse_pred_not(self) -> TestExp:
+        bak = self.pos
+        if self.consume_next_word_if_is("!"):
+            if (testexp := self.parse_pred_not()) != None:
+                return NotTestExp(testexp)
+            self.pos = bak
+        return self.parse_pred_primary()
+
+    def parse_pred_primary(self) -> TestExp:
         if (testexp := self.parse_pred_file_type()) != None:
             return testexp
         if (testexp := self.parse_pred_file_access()) != None:
             return testexp
         if (testexp := self.parse_pred_str_cmp()) != None:
             return testexp
+        if (testexp := self.parse_pred_int_cmp()) != None:
+            return testexp
         if (testexp := self.parse_pred_str_empty()) != None:
             return testexp
         return None
 
-    def parse_pred_str_empty(self) -> TestExp:
+    def parse_pred_cmd(self) -> TestExp:
         bak = self.pos
-        # test keyword
-        if not self.consume_next_word_if_is("test"):
+        cmd, redirects = self.consume_words_redirects()
+        if len(cmd) == 0:
             self.pos = bak
             return None
+        if self.next_is_pipe():
+            stmt = [CmdExp(cmd, redirects)]
+            if not self.parse_pipeline(stmt):
+                self.pos = bak
+                return None
+            return PipelineTestExp(stmt[0])
+        return CmdTestExp(cmd, redirects)
+
+    def parse_pred_str_empty(self) -> TestExp:
+        bak = self.pos
         # operator
         operator = None
         if (t := self.consume_next_word()) != None:
@@ -751,10 +1752,6 @@ class Parser:
 
     def parse_pred_file_type(self) -> TestExp:
         bak = self.pos
-        # test keyword
-        if not self.consume_next_word_if_is("test"):
-            self.pos = bak
-            return None
         # operator
         operator = None
         if (t := self.consume_next_word()) != None:
@@ -779,10 +1776,6 @@ class Parser:
 
     def parse_pred_file_access(self) -> TestExp:
         bak = self.pos
-        # test keyword
-        if not self.consume_next_word_if_is("test"):
-            self.pos = bak
-            return None
         # operator
         operator = None
         if (t := self.consume_next_word()) != None:
@@ -807,10 +1800,6 @@ class Parser:
 
     def parse_pred_str_cmp(self) -> TestExp:
         bak = self.pos
-        # test keyword
-        if not self.consume_next_word_if_is("test"):
-            self.pos = bak
-            return None
         lhs = None
         # lhs
         if (t := self.consume_next_word()) != None:
@@ -840,6 +1829,37 @@ class Parser:
         # success
         return StrCmpTestExp(operator, lhs, rhs)
 
+    def parse_pred_int_cmp(self) -> TestExp:
+        bak = self.pos
+        # lhs
+        lhs = None
+        if (t := self.consume_next_word()) != None:
+            lhs = t
+        else:
+            self.pos = bak
+            return None
+        # operator
+        operator = None
+        if (t := self.consume_next_word()) != None:
+            op = t.str
+            # check if operator is valid
+            if not (op in test_int_cmp_operators):
+                self.pos = bak
+                return None
+            operator = t
+        else:
+            self.pos = bak
+            return None
+        # rhs
+        rhs = None
+        if (t := self.consume_next_word()) != None:
+            rhs = t
+        else:
+            self.pos = bak
+            return None
+        # success
+        return IntCmpTestExp(operator, lhs, rhs)
+
     def parse_if(self, stmt: list[Exp]) -> bool:
         bak = (self.pos, stmt)
         # init for-exp fields
@@ -954,100 +1974,652 @@ class Parser:
         if not self.consume_next_word_if_is("done"):
             self.pos, stmt = bak
             return False
-        stmt.append(WhileExp(pred, body))
+        # input of the loop
+        redirects = []
+        pos = self.pos
+        if (r := self.consume_next_redirect()) != None:
+            if r[0] == "<":
+                redirects.append(r)
+            else:
+                self.pos = pos
+        stmt.append(WhileExp(pred, body, redirects))
         return True
     
     def parse_cmd(self, stmt: list[Exp]) -> bool:
-        cmd = []
-        while self.next_is_word():
-            cmd.append(self.consume_next_word())
-        stmt.append(CmdExp(cmd))
+        cmd, redirects = self.consume_words_redirects()
+        # nothing a command can start with, like a stray | or a
+        # redirection without its target
+        if len(cmd) == 0 and len(redirects) == 0:
+            return False
+        stmt.append(CmdExp(cmd, redirects))
         return True
 
+    def register_keyword(word: str, rule) -> None:
+        Parser.keyword_rules[word] = rule
+
+    kind_rules = {
+        Comment: parse_comment,
+        Newline: parse_newline,
+        Assign: parse_assign,
+    }
+
+    keyword_rules = {
+        "cd": parse_cd,
+        "echo": parse_echo,
+        "read": parse_read,
+        "exit": parse_exit,
+        "for": parse_for,
+        "if": parse_if,
+        "while": parse_while,
+    }
+
+    # rules that backtrack over whole blocks, and so are memoized
+    compound_rules = {parse_for, parse_if, parse_while}
+
+# rewrites of the statement list between the parser and the translator,
+# each run from an optimisation level up; the time each takes is kept
+class PassManager:
+    def __init__(self, level: int = 0) -> None:
+        self.level = level
+        self.times: list[tuple[str, float]] = []
+
+    def run(self, ast: list[Exp]) -> list[Exp]:
+        for name, level, run in PassManager.passes:
+            if self.level < level:
+                continue
+            start = time.perf_counter()
+            ast = run(ast)
+            self.times.append((name, time.perf_counter() - start))
+        return ast
+
+    # variables assigned once, at the top level, to a plain word are
+    # replaced by that word in the statements after the assignment
+    def const_prop(ast: list[Exp]) -> list[Exp]:
+        assigned = collections.Counter()
+        for node in walk(ast):
+            if AssignExp.is_assign_exp(node):
+                assigned[node.name] += 1
+            elif ForExp.is_for_exp(node):
+                assigned[node.var.str] += 1
+            elif ReadExp.is_read_exp(node) and node.arg != None:
+                assigned[node.arg.str] += 1
+            elif CmdTestExp.is_cmd_test_exp(node) and node.cmd[0].str == "read":
+                for word in node.cmd[1:]:
+                    assigned[word.str] += 1
+        for i, exp in enumerate(ast):
+            if AssignExp.is_assign_exp(exp) and assigned[exp.name] == 1 \
+                    and (value := PassManager.const_value(exp)) != None:
+                PassManager.substitute(ast[i+1:], exp.name, value)
+        return ast
+
+    # the value of an assignment that needs no quoting anywhere
+    def const_value(exp: AssignExp) -> str:
+        if len(exp.value.list) != 1:
+            return None
+        value, typ = exp.value.list[0]
+        if not FormatExp.is_format_exp(value) or any(Var.is_var(w) for w in value.list):
+            return None
+        value = "".join(w.str for w in value.list)
+        if re.fullmatch(r'[\w./:,+@%-]+', value) == None:
+            return None
+        return value
+
+    def substitute(explist: list[Exp], name: str, value: str) -> None:
+        def subst(word: Word) -> Word:
+            if word == None or SQuote.is_squote(word):
+                return word
+            if Var.is_var(word):
+                return Word(value) if word.name == name else word
+            s, n = re.subn(r'\$(?:%s\b|\{%s\})' % (name, name), lambda m: value, word.str)
+            return type(word)(s) if n > 0 else word
+        def subst_arith(exp: ArithExp) -> ArithExp:
+            if isinstance(exp, ArithVarExp) and exp.name == name and value.isdigit():
+                return ArithNumExp(int(value))
+            if isinstance(exp, ArithNegExp):
+                exp.exp = subst_arith(exp.exp)
+            elif isinstance(exp, ArithBinExp):
+                exp.lhs = subst_arith(exp.lhs)
+                exp.rhs = subst_arith(exp.rhs)
+            return exp
+        for node in walk(explist):
+            for field in PassManager.word_fields.get(type(node), ()):
+                words = getattr(node, field)
+                if field == "redirects":
+                    setattr(node, field, [(op, subst(w)) for op, w in words])
+                elif isinstance(words, list):
+                    setattr(node, field, list(map(subst, words)))
+                else:
+                    setattr(node, field, subst(words))
+            if not AssignExp.is_assign_exp(node):
+                continue
+            for i, (e, t) in enumerate(node.value.list):
+                if FormatExp.is_format_exp(e):
+                    e.list = list(map(subst, e.list))
+                elif GlobExp.is_glob_exp(e):
+                    e.str.list = list(map(subst, e.str.list))
+                elif CmdSubstExp.is_cmd_subst_exp(e):
+                    e.cmd = list(map(subst, e.cmd))
+                elif ArithExp.is_arith_exp(e):
+                    node.value.list[i] = (subst_arith(e), t)
+
+    # the words of a node, those in an assigned value included
+    def words(node: Exp) -> list[Word]:
+        words = []
+        for field in PassManager.word_fields.get(type(node), ()):
+            value = getattr(node, field)
+            if field == "redirects":
+                words.extend(w for op, w in value)
+            elif isinstance(value, list):
+                words.extend(value)
+            else:
+                words.append(value)
+        if AssignExp.is_assign_exp(node):
+            for e, t in node.value.list:
+                if FormatExp.is_format_exp(e):
+                    words.extend(e.list)
+                elif GlobExp.is_glob_exp(e):
+                    words.extend(e.str.list)
+                elif CmdSubstExp.is_cmd_subst_exp(e):
+                    words.extend(e.cmd)
+                elif ArithExp.is_arith_exp(e):
+                    words.extend(Word(name) for name in Translator.arith_names(e))
+        return words
+
+    # fields of each node that hold words the shell expands
+    word_fields = {
+        CdExp: ("dir",),
+        ExitExp: ("exit_code",),
+        EchoExp: ("args", "redirects"),
+        ForExp: ("iter",),
+        WhileExp: ("redirects",),
+        FileTypeTestExp: ("file",),
+        FileAccessTestExp: ("file",),
+        StrEmptyTestExp: ("str",),
+        StrCmpTestExp: ("lhs", "rhs"),
+        IntCmpTestExp: ("lhs", "rhs"),
+        CmdTestExp: ("cmd", "redirects"),
+        CmdExp: ("cmd", "redirects"),
+    }
+
+    # conditions on literal words, and true, false and : commands, become
+    # constants, which not, -a and -o are simplified through
+    def fold_tests(ast: list[Exp]) -> list[Exp]:
+        for node in walk(ast):
+            if IfExp.is_if_exp(node):
+                node.pred = list(map(PassManager.fold_test, node.pred))
+            elif WhileExp.is_while_exp(node):
+                node.pred = PassManager.fold_test(node.pred)
+        return ast
+
+    def fold_test(pred: TestExp) -> TestExp:
+        if NotTestExp.is_not_test_exp(pred):
+            pred.pred = PassManager.fold_test(pred.pred)
+            if ConstTestExp.is_const_test_exp(pred.pred):
+                return ConstTestExp(not pred.pred.value)
+        elif LogicTestExp.is_logic_test_exp(pred):
+            pred.lhs = PassManager.fold_test(pred.lhs)
+            pred.rhs = PassManager.fold_test(pred.rhs)
+            # the right side is only run when the left does not decide
+            if ConstTestExp.is_const_test_exp(pred.lhs):
+                return pred.rhs if pred.lhs.value == (pred.op == "and") else pred.lhs
+        elif StrCmpTestExp.is_str_cmp_test_exp(pred):
+            lhs, rhs = literal_word(pred.lhs), literal_word(pred.rhs)
+            if lhs != None and rhs != None:
+                return ConstTestExp((lhs == rhs) == (pred.op.str == "="))
+        elif StrEmptyTestExp.is_str_empty_test_exp(pred):
+            if (s := literal_word(pred.str)) != None:
+                return ConstTestExp((s == "") == (pred.op.str == "-z"))
+        elif IntCmpTestExp.is_int_cmp_test_exp(pred):
+            lhs, rhs = literal_word(pred.lhs), literal_word(pred.rhs)
+            if lhs != None and rhs != None and re.fullmatch(r'-?\d+', lhs) \
+                    and re.fullmatch(r'-?\d+', rhs):
+                return ConstTestExp(int_cmp_functions[pred.op.str](int(lhs), int(rhs)))
+        elif CmdTestExp.is_cmd_test_exp(pred) and len(pred.redirects) == 0:
+            name = literal_word(pred.cmd[0])
+            if name in ("true", ":", "false"):
+                return ConstTestExp(name != "false")
+        return pred
+
+    # if branches whose condition is false are dropped, as is everything
+    # after one that is true; a while loop that never runs goes too
+    def prune_branches(ast: list[Exp]) -> list[Exp]:
+        out = []
+        for exp in ast:
+            if IfExp.is_if_exp(exp):
+                preds, branches = [], []
+                rest = exp.branch[-1] if len(exp.branch) > len(exp.pred) else None
+                for pred, branch in zip(exp.pred, exp.branch):
+                    if ConstTestExp.is_const_test_exp(pred):
+                        if pred.value:
+                            rest = branch
+                            break
+                        continue
+                    preds.append(pred)
+                    branches.append(branch)
+                if len(preds) == 0:
+                    out.extend(PassManager.prune_branches(rest or []))
+                    continue
+                if rest != None:
+                    branches.append(rest)
+                exp.pred = preds
+                exp.branch = [PassManager.nonempty(PassManager.prune_branches(b)) for b in branches]
+            elif WhileExp.is_while_exp(exp):
+                if ConstTestExp.is_const_test_exp(exp.pred) and not exp.pred.value:
+                    continue
+                exp.body = PassManager.nonempty(PassManager.prune_branches(exp.body))
+            elif ForExp.is_for_exp(exp):
+                exp.body = PassManager.nonempty(PassManager.prune_branches(exp.body))
+            out.append(exp)
+        return out
+
+    # a block left with no statement gets a : so it still translates
+    def nonempty(block: list[Exp]) -> list[Exp]:
+        if all(NewlineExp.is_newline_exp(e) or CommentExp.is_comment_exp(e) for e in block):
+            return [CmdExp([Word(":")])] + block
+        return block
+
+    # statements after an exit in the same block never run
+    def dead_exit(ast: list[Exp]) -> list[Exp]:
+        out = []
+        for i, exp in enumerate(ast):
+            out.append(exp)
+            if ForExp.is_for_exp(exp) or WhileExp.is_while_exp(exp):
+                exp.body = PassManager.dead_exit(exp.body)
+            elif IfExp.is_if_exp(exp):
+                exp.branch = list(map(PassManager.dead_exit, exp.branch))
+            elif ExitExp.is_exit_exp(exp):
+                # the rest of its line
+                for e in ast[i+1:]:
+                    if not CommentExp.is_comment_exp(e):
+                        if NewlineExp.is_newline_exp(e):
+                            out.append(e)
+                        break
+                    out.append(e)
+                break
+        return out
+
+    passes = [
+        ("const-prop", 2, const_prop),
+        ("fold-tests", 1, fold_tests),
+        ("prune-branches", 1, prune_branches),
+        ("dead-exit", 1, dead_exit),
+    ]
+
 class Translator:
-    def __init__(self, ast: list[Exp]) -> None:
+    def __init__(self, ast: list[Exp], **options) -> None:
         self.ast = ast
+        self.asyncio_import = False
+        self.concurrent_futures_import = False
         self.glob_import = False
         self.os_import = False
         self.subprocess_import = False
         self.sys_import = False
+        self.threading_import = False
+        self.locale_import = False
+        self.shutil_import = False
+        self.native_coreutils = options.get("native_coreutils", False)
+        # threads to run the iterations of independent for loops on
+        self.parallel_loops = options.get("parallel_loops", 0)
+        # background jobs as asyncio subprocesses instead of Popen
+        self.async_jobs = options.get("async_jobs", False)
+        # leave out imports of modules the code never refers to
+        self.prune_imports = options.get("opt_level", 0) >= 1
+        # import the runtime functions from sheepy_rt instead of defining
+        # them, and call its globs, file tests and commands too
+        self.runtime_module = options.get("runtime", "inline") == "import"
+        # runtime functions the program defines or imports
+        self.helpers: set[str] = set()
         self.env = {}
+        # whether each variable assigned so far only ever holds an int
+        self.is_int: dict[str, bool] = {}
+        # indent of the statement being translated
+        self.indent = 0
+        # append targets opened once for a loop: word -> (handle, path code)
+        self.hoisted: dict[str, tuple[str, str]] = {}
+        self.handles = 0
+        # what read reads from, and how many loops it is in
+        self.stdin = "sys.stdin"
+        self.loops = 0
+        # globs and file tests computed once before a loop: code -> name,
+        # None until the loop uses it
+        self.invariants: dict[str, str] = {}
+        self.invariant_count = 0
 
     def translate(self) -> str:
-        header = "#!/usr/bin/python3 -u\n"
+        self.type_vars(self.ast)
         body = self.translate_sequence(self.ast)
-        if self.glob_import:
-            header += "import glob\n"
-        if self.os_import:
-            header += "import os\n"
-        if self.subprocess_import:
-            header += "import subprocess\n"
-        if self.sys_import:
-            header += "import sys\n"
-        return header + body
+        if self.prune_imports:
+            self.drop_imports(names_used(body))
+        return self.header() + body
+
+    # write the program to sink one top-level statement at a time; the
+    # imports are worked out by a pre-pass so the header can go first
+    def translate_to(self, sink) -> None:
+        self.type_vars(self.ast)
+        if self.prune_imports:
+            self.dry_run()
+        else:
+            self.scan_sequence(self.ast)
+        sink.write(self.header())
+        sink.flush()
+        self.emit_sequence(self.ast, 0, [], sink)
+
+    # translate_to for a script too big to hold: statements() parses it
+    # afresh each call, once to type the variables and find the imports and
+    # once more to write each statement as soon as it is parsed; for when
+    # no pass or parallel loop needs the whole tree
+    def translate_stream(self, statements, sink) -> None:
+        for exp in statements():
+            self.visit_types([exp])
+            self.scan_sequence([exp])
+        self.type_vars([])
+        sink.write(self.header())
+        sink.flush()
+        for exp in statements():
+            self.emit_sequence([exp], 0, [], sink)
+
+    def header(self) -> str:
+        header = "#!/usr/bin/python3 -u\n"
+        for module in Translator.modules:
+            if getattr(self, Translator.import_flag(module)):
+                header += f"import {module}\n"
+        if self.runtime_module:
+            names = [n for name in sorted(self.helpers) for n in runtime_names(name)]
+            if len(names) > 0:
+                header += "from sheepy_rt import {}\n".format(", ".join(names))
+            return header
+        for name in sorted(self.helpers):
+            header += runtime_helpers[name]
+        return header
+
+    # clear the flags of modules that neither the code nor the runtime
+    # helpers it uses refer to
+    def drop_imports(self, used: set[str]) -> None:
+        if not self.runtime_module:
+            for name in self.helpers:
+                used |= names_used(runtime_helpers[name])
+        for module in Translator.modules:
+            if module.split(".")[0] not in used:
+                setattr(self, Translator.import_flag(module), False)
+
+    # translate the whole program, keeping only the names it uses, so the
+    # imports are exactly those translate would leave
+    def dry_run(self) -> None:
+        env = dict(self.env)
+        sink = NameSink()
+        self.emit_sequence(self.ast, 0, [], sink)
+        sink.flush()
+        self.env = env
+        self.handles = 0
+        self.invariant_count = 0
+        self.drop_imports(sink.names)
+
+    # modules the program may import, each with a <name>_import flag
+    modules = ["asyncio", "concurrent.futures", "glob", "locale", "os", "shutil",
+               "subprocess", "sys", "threading"]
+
+    def import_flag(module: str) -> str:
+        return module.replace(".", "_") + "_import"
+
+    def use_helper(self, name: str) -> None:
+        self.helpers.add(name)
+        if self.runtime_module:
+            return
+        for module in runtime_imports[name]:
+            setattr(self, Translator.import_flag(module), True)
+
+    def use_glob(self) -> None:
+        if self.runtime_module:
+            self.use_helper("sh_glob")
+        else:
+            self.glob_import = True
+
+    def use_file_test(self) -> None:
+        if self.runtime_module:
+            self.use_helper("sh_test")
+        else:
+            self.os_import = True
+
+    # the call running a command, with its argument and stream code
+    def call_code(self, args: list[str], streams: dict[str, str]) -> str:
+        if self.runtime_module:
+            self.use_helper("sh_call")
+            fmt = "sh_call([{}]{})"
+        else:
+            self.subprocess_import = True
+            fmt = "subprocess.call([{}]{})"
+        return fmt.format(", ".join(args), Translator.stream_args(streams))
     
     def translate_sequence(self, explist: list[object], indent: int = 0) -> str:
-        body = ""
+        out: list[str] = []
+        self.emit_sequence(explist, indent, out)
+        return "".join(out)
+
+    # append the code for explist to out, dispatching on the node type;
+    # with a sink, out is written to it and emptied after every node
+    def emit_sequence(self, explist: list[object], indent: int, out: list[str],
+                      sink = None) -> None:
+        start = len(out)
         beginning_of_line = True
         shift_str = indent * 4 * " "
         for exp in explist:
             if beginning_of_line:
-                body += shift_str
+                out.append(shift_str)
                 beginning_of_line = False
             # TODO insert space between cmd and trailing comment
             # which require another state
-            increment = self.translate_newline(exp)
-            if increment != "":
-                beginning_of_line = True
-                body += increment
-                continue
-            increment = self.translate_comment(exp)
-            if increment != "":
-                beginning_of_line = True
-                body += increment
-                continue
-            increment = self.translate_assign(exp)
-            if increment != "":
-                beginning_of_line = True
-                body += increment
-                continue
-            increment = self.translate_cd(exp)
-            if increment != "":
+            if (entry := Translator.emitter(type(exp))) == None:
+                # none of these matches
+                eprint("translate clause not implemented")
+                del out[start:]
+                out.append("error: not valid exp")
+                return
+            emit, ends_line, compound = entry
+            self.indent = indent
+            if self.hoisted and Translator.runs_external(exp):
+                out.append("".join(line + "\n" + shift_str for line in self.flush_code()))
+            if compound:
+                emit(self, exp, indent, out)
+            else:
+                out.append(emit(self, exp))
+            if ends_line:
                 beginning_of_line = True
-                body += increment
-                continue
-            increment = self.translate_exit(exp)
-            if increment != "":
-                body += increment
-                continue
-            increment = self.translate_read(exp)
-            if increment != "":
-                body += increment
-                continue
-            increment = self.translate_echo(exp)
-            if increment != "":
-                body += increment
+            if sink != None:
+                sink.write("".join(out))
+                out.clear()
+
+    def emitter(typ: type) -> tuple:
+        for cls in typ.__mro__:
+            if (entry := Translator.emitters.get(cls)) != None:
+                return entry
+        return None
+
+    # a variable is an int when every assignment to it is arithmetic or
+    # an integer literal, so its uses need no int() and its value no str()
+    def type_vars(self, explist: list[object]) -> None:
+        self.visit_types(explist)
+        for name, ok in self.is_int.items():
+            if ok:
+                self.env[name] = IntTyp()
+
+    # note the assignments of statements for type_vars, which can be given
+    # them a few at a time and then none
+    def visit_types(self, explist: list[object]) -> None:
+        is_int = self.is_int
+        # read in a condition assigns strings, as ReadExp does
+        def visit_preds(preds: list[TestExp]) -> None:
+            for pred in walk(preds):
+                if CmdTestExp.is_cmd_test_exp(pred) and len(pred.cmd) > 0 \
+                        and pred.cmd[0].str == "read":
+                    for arg in pred.cmd[1:]:
+                        if not arg.str.startswith("-"):
+                            is_int[arg.str] = False
+        def visit(explist: list[object]) -> None:
+            for exp in explist:
+                if AssignExp.is_assign_exp(exp):
+                    ok = Translator.int_value(exp.value) != None
+                    is_int[exp.name] = is_int.get(exp.name, True) and ok
+                elif ForExp.is_for_exp(exp):
+                    is_int[exp.var.str] = False
+                    visit(exp.body)
+                elif ReadExp.is_read_exp(exp):
+                    if exp.arg != None:
+                        is_int[exp.arg.str] = False
+                elif IfExp.is_if_exp(exp):
+                    visit_preds(exp.pred)
+                    for branch in exp.branch:
+                        visit(branch)
+                elif WhileExp.is_while_exp(exp):
+                    visit_preds([exp.pred])
+                    visit(exp.body)
+        visit(explist)
+
+    # the arithmetic or integer literal an assigned value is, or None
+    def int_value(value: Exp) -> ArithExp:
+        if not ListExp.is_list_exp(value) or len(value.list) != 1:
+            return None
+        exp = value.list[0][0]
+        if ArithExp.is_arith_exp(exp):
+            return exp
+        if FormatExp.is_format_exp(exp) and len(exp.list) == 1 and not Var.is_var(exp.list[0]):
+            # only literals that print back the same, so 007 and -0 stay strings
+            if re.fullmatch(r'-?\d+', s := exp.list[0].str) and str(int(s)) == s:
+                return ArithNumExp(int(s))
+        return None
+
+    def is_int_var(self, name: str) -> bool:
+        return IntTyp.is_int_typ(self.env.get(name))
+
+    # import pre-pass: sets the same *_import flags translating would,
+    # without generating any code
+
+    def scan_sequence(self, explist: list[object]) -> None:
+        for exp in explist:
+            for cls in type(exp).__mro__:
+                if (scan := Translator.scanners.get(cls)) != None:
+                    scan(self, exp)
+                    break
+
+    def scan_words(self, words: list[Word]) -> None:
+        for word in words:
+            if SQuote.is_squote(word) or DQuote.is_dquote(word):
                 continue
-            increment = self.translate_for(exp, indent)
-            if increment != "":
-                body += increment
+            if word.str == "$#":
+                self.sys_import = True
                 continue
-            increment = self.translate_if(exp, indent)
-            if increment != "":
-                body += increment
+            if "$!" in word.str:
+                self.use_jobs()
+            if (arith := Arith.parse_word(word.str)) != None:
+                self.scan_arith(arith)
                 continue
-            increment = self.translate_while(exp, indent)
-            if increment != "":
-                body += increment
+            if (subst := CmdSubstExp.parse_word(word.str)) != None:
+                self.translate_subst(subst)
                 continue
-            increment = self.translate_cmd(exp)
-            if increment != "":
-                body += increment
+            if Var.is_var(word):
+                names = [word.name]
+            elif '$' in word.str:
+                names = re.findall(r'\${?(\w+)}?', word.str)
+            else:
+                if is_glob_str(word.str):
+                    self.use_glob()
                 continue
-            # none of these matches
-            eprint("translate clause not implemented")
-            return "error: not valid exp"
-        return body
+            if any(re.fullmatch(r'\d+', name) for name in names):
+                self.sys_import = True
+
+    def scan_pred(self, pred: TestExp) -> None:
+        if FileTypeTestExp.is_file_type_test_exp(pred) or FileAccessTestExp.is_file_access_test_exp(pred):
+            self.use_file_test()
+            self.scan_words([pred.file])
+        elif StrCmpTestExp.is_str_cmp_test_exp(pred):
+            self.scan_words([pred.lhs, pred.rhs])
+        elif StrEmptyTestExp.is_str_empty_test_exp(pred):
+            self.scan_words([pred.str])
+        elif IntCmpTestExp.is_int_cmp_test_exp(pred):
+            self.scan_words([pred.lhs, pred.rhs])
+            if self.translate_int_word(pred.lhs) == None or self.translate_int_word(pred.rhs) == None:
+                self.use_helper("sh_int_cmp")
+        elif NotTestExp.is_not_test_exp(pred):
+            self.scan_pred(pred.pred)
+        elif LogicTestExp.is_logic_test_exp(pred):
+            self.scan_pred(pred.lhs)
+            self.scan_pred(pred.rhs)
+        elif CmdTestExp.is_cmd_test_exp(pred) or PipelineTestExp.is_pipeline_test_exp(pred):
+            self.translate_pred(pred)
+
+    def scan_assign(self, exp: AssignExp) -> None:
+        if any(GlobExp.is_glob_exp(e) for e, t in exp.value.list):
+            self.use_glob()
+        for e, t in exp.value.list:
+            if FormatExp.is_format_exp(e):
+                if any(Var.is_var(w) and re.fullmatch(r'\d+', w.name) for w in e.list):
+                    self.sys_import = True
+                if any("$!" in w.str for w in e.list):
+                    self.use_jobs()
+            if ArithExp.is_arith_exp(e):
+                self.scan_arith(e)
+            elif CmdSubstExp.is_cmd_subst_exp(e):
+                self.translate_subst(e)
+
+    def arith_names(exp: ArithExp) -> list[str]:
+        if isinstance(exp, ArithVarExp):
+            return [exp.name]
+        if isinstance(exp, ArithNegExp):
+            return Translator.arith_names(exp.exp)
+        if isinstance(exp, ArithBinExp):
+            return Translator.arith_names(exp.lhs) + Translator.arith_names(exp.rhs)
+        return []
+
+    def scan_arith(self, exp: ArithExp) -> None:
+        if isinstance(exp, ArithVarExp):
+            if exp.name == "#" or re.fullmatch(r'\d+', exp.name):
+                self.sys_import = True
+        elif isinstance(exp, ArithNegExp):
+            self.scan_arith(exp.exp)
+        elif isinstance(exp, ArithBinExp):
+            if exp.op in ("/", "%") and Translator.fold_arith(exp) == None:
+                self.use_helper("sh_div")
+            self.scan_arith(exp.lhs)
+            self.scan_arith(exp.rhs)
+
+    def scan_cd(self, exp: CdExp) -> None:
+        self.os_import = True
+        self.scan_words([exp.dir])
+
+    def scan_exit(self, exp: ExitExp) -> None:
+        self.sys_import = True
+
+    def scan_read(self, exp: ReadExp) -> None:
+        self.sys_import = True
+
+    def scan_echo(self, exp: EchoExp) -> None:
+        self.translate_echo(exp)
+
+    def scan_for(self, exp: ForExp) -> None:
+        if self.parallel_for(exp) != None:
+            return
+        self.scan_words(exp.iter)
+        self.scan_sequence(exp.body)
+
+    def scan_if(self, exp: IfExp) -> None:
+        for pred in exp.pred:
+            self.scan_pred(pred)
+        for branch in exp.branch:
+            self.scan_sequence(branch)
+
+    def scan_while(self, exp: WhileExp) -> None:
+        if len(exp.redirects) > 0:
+            self.scan_words([exp.redirects[0][1]])
+        if Translator.read_var(exp.pred) != None:
+            if len(exp.redirects) == 0:
+                self.sys_import = True
+        else:
+            self.scan_pred(exp.pred)
+        self.scan_sequence(exp.body)
+
+    # whether a builtin is translated natively depends on its arguments,
+    # so commands are translated and the code thrown away
+    def scan_cmd(self, exp: CmdExp) -> None:
+        self.translate_cmd(exp)
     
     def translate_newline(self, exp: Exp) -> str:
         if NewlineExp.is_newline_exp(exp):
@@ -1056,7 +2628,7 @@ class Translator:
 
     def translate_comment(self, exp: Exp) -> str:
         if CommentExp.is_comment_exp(exp):
-            return f"#{exp.content}"
+            return exp.content
         return ""
     
     # TODO implement word str only
@@ -1066,6 +2638,16 @@ class Translator:
             return word.str
         if DQuote.is_dquote(word):
             return word.str
+        if word.str == "$#":
+            self.sys_import = True
+            return "str(len(sys.argv[1:]))"
+        if word.str == "$!":
+            self.use_jobs()
+            return "sh_last_pid()"
+        if (arith := Arith.parse_word(word.str)) != None:
+            return "str({})".format(self.translate_arith(arith))
+        if (subst := CmdSubstExp.parse_word(word.str)) != None:
+            return self.translate_subst(subst)
         if Var.is_var(word):
             name = word.name
             if re.fullmatch(r'\d+', name): # sys.argv[name]
@@ -1077,6 +2659,9 @@ class Translator:
     
     # check variable embedded in a word
     def translate_word_str(self, word: str) -> str:
+        if "$!" in word:
+            self.use_jobs()
+            word = word.replace("$!", "{sh_last_pid()}")
         if '$' in word:
             vars = re.findall(r'\${?(\w+)}?', word)
             eprint(vars)
@@ -1096,10 +2681,29 @@ class Translator:
             eprint(new_content)
             return new_content
         if is_glob_str(word):
-            self.glob_import = True
-            return f'" ".join(sorted(glob.glob("{word}")))'
+            return '" ".join({})'.format(self.glob_code(f'"{word}"'))
         return f"'{word}'"
     
+    # sorted expansion of a pattern
+    def glob_code(self, pattern: str) -> str:
+        self.use_glob()
+        return self.invariant(self.glob_call(pattern))
+
+    def glob_call(self, pattern: str) -> str:
+        if self.runtime_module:
+            return f"sh_glob({pattern})"
+        return f"sorted(glob.glob({pattern}))"
+
+    # the name code is computed into before the loop, if it is
+    def invariant(self, code: str) -> str:
+        if code not in self.invariants:
+            return code
+        if self.invariants[code] == None:
+            self.invariant_count += 1
+            kind = "glob" if code.startswith(("sorted(glob.glob(", "sh_glob(")) else "test"
+            self.invariants[code] = f"_sheepy_{kind}{self.invariant_count}"
+        return self.invariants[code]
+
     def translate_cd(self, exp: Exp) -> str:
         if CdExp.is_cd_exp(exp):
             self.os_import = True
@@ -1118,13 +2722,22 @@ class Translator:
             else:
                 return f"[{', '.join(elem_str_list)}]"
         elif GlobExp.is_glob_exp(exp):
-            self.glob_import = True
-            return f"sorted(glob.glob({self.translate_value(exp.str)}))"
+            return self.glob_code(self.translate_value(exp.str))
+        elif ArithExp.is_arith_exp(exp):
+            return self.translate_arith(exp)
+        elif CmdSubstExp.is_cmd_subst_exp(exp):
+            return self.translate_subst(exp)
         elif FormatExp.is_format_exp(exp):
             substrs = []
             for word in exp.list:
-                if Var.is_var(word):
+                if Var.is_var(word) and re.fullmatch(r'\d+', word.name):
+                    self.sys_import = True
+                    substrs.append("{sys.argv[" + word.name + "]}")
+                elif Var.is_var(word):
                     substrs.append("{" + word.name + "}")
+                elif "$!" in word.str:
+                    self.use_jobs()
+                    substrs.append(word.str.replace("$!", "{sh_last_pid()}"))
                 else:
                     substrs.append(word.str)
             fmt_str_content = "".join(substrs)
@@ -1135,6 +2748,9 @@ class Translator:
             fmt = "{} = {}"
             name = exp.name
             #value = self.translate_word_str(exp.value)
+            if self.is_int_var(name):
+                value = self.translate_arith(Translator.int_value(exp.value))
+                return fmt.format(name, value)
             if ListExp.is_list_exp(exp.value) and len(exp.value.list) > 1:
                 self.env[name] = ListTyp()
             elif GlobExp.is_glob_exp(exp.value):
@@ -1163,6 +2779,9 @@ class Translator:
             self.sys_import = True
             #fmt = "{}sys.stdin.readline().strip()"
             fmt = "{}input()"
+            # a loop reads its lines through the buffer
+            if self.loops > 0 or self.stdin != "sys.stdin":
+                fmt = "{}" + self.stdin + ".readline().strip(' \\t\\n')"
             arg = None
             if exp.arg == None:
                 arg = ""
@@ -1176,21 +2795,129 @@ class Translator:
         if EchoExp.is_echo_exp(exp):
             fmt = "print({})"
             args: list[str] = list(map(self.translate_word, exp.args))
+            prefix, items, streams = self.translate_redirects(exp.redirects)
+            if "stdout" in streams:
+                if streams["stdout"] == "subprocess.DEVNULL":
+                    return self.join_redirected(prefix, items, "pass")
+                args.append("file={}".format(streams["stdout"]))
             code = fmt.format(", ".join(args))
-            return code
+            return self.join_redirected(prefix, items, code)
         return ""
 
-    def translate_for(self, exp: Exp, indent: int) -> str:
-        if ForExp.is_for_exp(exp):
-            fmt = "for {} in {}:\n"
-            var = exp.var.str
-            iterlist = list(map(self.translate_word, exp.iter))
-            for_header = fmt.format(var, ", ".join(iterlist))
-            body = self.translate_sequence(exp.body, indent+1)
-            return for_header + body
-        return ""
+    # files opened for redirections: statements to run first, items for
+    # a with statement, and the handle for each redirected stream
+    def translate_redirects(self, redirects: list[tuple[str, Word]],
+                            inline: bool = False) -> tuple[list[str], list[str], dict[str, str]]:
+        prefix = []
+        items = []
+        streams = {}
+        for op, target in redirects:
+            stream = "stdin" if op == "<" else "stderr" if op[0] == "2" else "stdout"
+            if target == None:
+                if op[-1] == "2" and stream == "stdout":
+                    self.sys_import = True
+                    streams["stdout"] = "sys.stderr"
+                elif op[-1] == "1" and stream == "stderr":
+                    self.subprocess_import = True
+                    streams["stderr"] = "subprocess.STDOUT"
+                continue
+            if stream != "stdin" and literal_word(target) == "/dev/null":
+                self.subprocess_import = True
+                streams[stream] = "subprocess.DEVNULL"
+                continue
+            if not inline and op.endswith(">>") and target.str in self.hoisted:
+                name, path = self.hoisted[target.str]
+                prefix.append(f"if {name} is None: {name} = open({path}, 'a')")
+                streams[stream] = name
+                continue
+            mode = "'r'" if stream == "stdin" else "'a'" if op.endswith(">>") else "'w'"
+            code = "open({}, {})".format(self.translate_word(target), mode)
+            if inline:
+                # closed once the call drops its reference
+                streams[stream] = code
+            else:
+                name = f"_sheepy_{stream}"
+                items.append(f"{code} as {name}")
+                streams[stream] = name
+        return (prefix, items, streams)
+
+    def join_redirected(self, prefix: list[str], items: list[str], code: str) -> str:
+        if len(items) > 0:
+            code = "with {}: {}".format(", ".join(items), code)
+        shift_str = self.indent * 4 * " "
+        return "".join(line + "\n" + shift_str for line in prefix) + code
+
+    def emit_for(self, exp: ForExp, indent: int, out: list[str]) -> None:
+        if (code := self.parallel_for(exp)) != None:
+            out.append(code)
+            return
+        inner, loop = self.begin_loop(exp, indent, out)
+        fmt = "for {} in {}:\n"
+        var = exp.var.str
+        out.append(fmt.format(var, self.for_items(exp.iter)))
+        self.loops += 1
+        self.emit_sequence(exp.body, inner+1, out)
+        self.loops -= 1
+        self.end_loop(indent, out, loop)
+
+    # the values a for loop runs over, a glob giving each file it matches
+    def for_items(self, words: list[Word], bare: bool = True) -> str:
+        items = []
+        for word in words:
+            if not SQuote.is_squote(word) and not DQuote.is_dquote(word) \
+                    and '$' not in word.str and is_glob_str(word.str):
+                items.append("*" + self.glob_code(f'"{word.str}"'))
+            else:
+                items.append(self.translate_word(word))
+        if len(items) == 1 and items[0].startswith("*"):
+            return items[0][1:]
+        if bare and not any(item.startswith("*") for item in items):
+            return ", ".join(items)
+        return "[{}]".format(", ".join(items))
+
+    # a for loop whose iterations can run at once, as the code handing
+    # them to a pool of threads: the body only runs external commands
+    # that use the loop variable, with no redirections, and the variable
+    # is not used outside the loop; None when it is not one
+    def parallel_for(self, exp: ForExp) -> str:
+        if self.parallel_loops < 2:
+            return None
+        var = exp.var.str
+        uses = re.compile(r'\b%s\b' % var)
+        commands = []
+        for e in exp.body:
+            if NewlineExp.is_newline_exp(e) or CommentExp.is_comment_exp(e):
+                continue
+            if not CmdExp.is_cmd_exp(e) or len(e.cmd) == 0 or len(e.redirects) > 0:
+                return None
+            name = e.cmd[0].str
+            if name in Translator.builtins or self.native_coreutils and name in Translator.coreutils:
+                return None
+            if any('`' in w.str or '$(' in w.str.replace('$((', '') for w in e.cmd):
+                return None
+            if not any(uses.search(w.str) for w in e.cmd):
+                return None
+            commands.append(e)
+        if len(commands) == 0:
+            return None
+        inside = set(map(id, walk(exp.body)))
+        for node in walk(self.ast):
+            if node is exp or id(node) in inside:
+                continue
+            if any(w != None and uses.search(w.str) for w in PassManager.words(node)):
+                return None
+        self.subprocess_import = True
+        self.use_helper("sh_parallel")
+        argv = ", ".join(self.words_code(e.cmd) for e in commands)
+        return "sh_parallel(([{}] for {} in {}), {})".format(
+            argv, var, self.for_items(exp.iter, bare=False), self.parallel_loops)
 
     def translate_pred(self, pred: TestExp) -> str:
+        if (FileTypeTestExp.is_file_type_test_exp(pred) or FileAccessTestExp.is_file_access_test_exp(pred)) \
+                and self.runtime_module:
+            self.use_file_test()
+            code = "sh_test('{}', {})".format(pred.op.str, self.translate_word(pred.file))
+            return self.invariant(code)
         if FileTypeTestExp.is_file_type_test_exp(pred):
             self.os_import = True
             code_func = None
@@ -1202,7 +2929,7 @@ class Translator:
                 code_func = "isdir"
             code_file = self.translate_word(pred.file)
             code = "os.path.{}({})".format(code_func, code_file)
-            return code
+            return self.invariant(code)
         if FileAccessTestExp.is_file_access_test_exp(pred):
             self.os_import = True
             code_flag = None
@@ -1214,7 +2941,7 @@ class Translator:
                 code_flag = "os.X_OK"
             code_file = self.translate_word(pred.file)
             code = "os.access({}, {})".format(code_file, code_flag)
-            return code
+            return self.invariant(code)
         if StrCmpTestExp.is_str_cmp_test_exp(pred):
             code_op = None
             if pred.op.str == "=":
@@ -1234,61 +2961,1501 @@ class Translator:
             code_lhs = self.translate_word(pred.str)
             code = "{} {} ''".format(code_lhs, code_op)
             return code
-        return ""
-
-    def translate_if(self, exp: Exp, indent: int) -> str:
-        if IfExp.is_if_exp(exp):
-            iffmt = "if {}:\n"
-            pred_str = self.translate_pred(exp.pred[0])
-            if_header = iffmt.format(pred_str)
-            body = self.translate_sequence(exp.branch[0], indent+1)
-            code = if_header + body
-            eliffmt = "elif {}:\n"
-            for i in range(1, len(exp.pred)):
-                pred_str = self.translate_pred(exp.pred[i])
-                elif_header = eliffmt.format(pred_str)
-                body = self.translate_sequence(exp.branch[i], indent+1)
-                code += elif_header + body
-            if len(exp.branch) > len(exp.pred): # else
-                else_header = "else:\n"
-                body = self.translate_sequence(exp.branch[-1], indent+1)
-                code += else_header + body
+        if IntCmpTestExp.is_int_cmp_test_exp(pred):
+            code_op = int_cmp_operators[pred.op.str]
+            code_lhs = self.translate_int_word(pred.lhs)
+            code_rhs = self.translate_int_word(pred.rhs)
+            if code_lhs == None or code_rhs == None:
+                self.use_helper("sh_int_cmp")
+                code_lhs = code_lhs or self.translate_int_str(pred.lhs)
+                code_rhs = code_rhs or self.translate_int_str(pred.rhs)
+                return "sh_int_cmp('{}', {}, {})".format(pred.op.str, code_lhs, code_rhs)
+            code = "{} {} {}".format(code_lhs, code_op, code_rhs)
             return code
+        if NotTestExp.is_not_test_exp(pred):
+            code = self.translate_pred(pred.pred)
+            if LogicTestExp.is_logic_test_exp(pred.pred):
+                code = "({})".format(code)
+            return "not {}".format(code)
+        if LogicTestExp.is_logic_test_exp(pred):
+            code_lhs = self.translate_pred(pred.lhs)
+            code_rhs = self.translate_pred(pred.rhs)
+            # && and || bind equally, and or looser than and
+            if pred.op == "and":
+                if LogicTestExp.is_logic_test_exp(pred.lhs) and pred.lhs.op == "or":
+                    code_lhs = "({})".format(code_lhs)
+                if LogicTestExp.is_logic_test_exp(pred.rhs) and pred.rhs.op == "or":
+                    code_rhs = "({})".format(code_rhs)
+            return "{} {} {}".format(code_lhs, pred.op, code_rhs)
+        if ConstTestExp.is_const_test_exp(pred):
+            return str(pred.value)
+        if PipelineTestExp.is_pipeline_test_exp(pred):
+            prefix, items, code = self.pipeline_code(pred.pipeline, inline=True)
+            return "not {}".format(code)
+        if CmdTestExp.is_cmd_test_exp(pred):
+            name = pred.cmd[0].str
+            if (builtin := Translator.builtin_preds.get(name)) != None and len(pred.redirects) == 0:
+                if (code := builtin(self, pred.cmd)) != None:
+                    return code
+            if self.native_coreutils and len(pred.redirects) == 0 \
+                    and (native := Translator.coreutils.get(name)) != None and native[1]:
+                if (code := native[0](self, pred.cmd)) != None:
+                    return "not {}".format(code)
+            args: list[str] = list(map(self.translate_word, pred.cmd))
+            prefix, items, streams = self.translate_redirects(pred.redirects, inline=True)
+            return "not " + self.call_code(args, streams)
         return ""
 
-    def translate_while(self, exp: Exp, indent: int) -> str:
-        if WhileExp.is_while_exp(exp):
+    # command substitution: folded to a constant when the command is pure
+    # and its arguments literal, an expression when it is pure, and
+    # otherwise run as a process
+    def translate_subst(self, exp: CmdSubstExp) -> str:
+        name = exp.cmd[0].str
+        if (subst := Translator.substs.get(name)) != None:
+            args = [literal_word(w) for w in exp.cmd[1:]]
+            if subst[0] != None and None not in args and (value := subst[0](args)) != None:
+                return repr(value.rstrip("\n"))
+            if (code := subst[1](self, exp.cmd[1:])) != None:
+                return code
+        self.subprocess_import = True
+        fmt = "subprocess.run([{}], stdout=subprocess.PIPE, text=True).stdout.rstrip('\\n')"
+        args: list[str] = list(map(self.translate_word, exp.cmd))
+        return fmt.format(", ".join(args))
+
+    def fold_echo(args: list[str]) -> str:
+        # dash's echo expands backslash escapes
+        if any("\\" in arg for arg in args):
+            return None
+        return " ".join(args) + "\n"
+
+    def subst_echo(self, args: list[Word]) -> str:
+        if any(not SQuote.is_squote(w) and "\\" in w.str for w in args):
+            return None
+        code_args: list[str] = list(map(self.translate_word, args))
+        if len(code_args) == 1:
+            return code_args[0]
+        return "' '.join([{}])".format(", ".join(code_args))
+
+    # literal arguments are already folded by printf_format
+    def subst_printf(self, args: list[Word]) -> str:
+        if (parts := self.printf_format([None] + args)) == None:
+            return None
+        if len(parts[1]) == 0:
+            return repr((parts[0] % ()).rstrip("\n"))
+        return "({}).rstrip('\\n')".format(self.printf_code([None] + args))
+
+    def fold_basename(args: list[str]) -> str:
+        if len(args) not in (1, 2) or args[0].startswith("-"):
+            return None
+        base = args[0].rstrip("/")
+        base = base[base.rfind("/")+1:] or args[0][:1]
+        if len(args) == 2 and base != args[1] and base.endswith(args[1]):
+            base = base[:len(base)-len(args[1])]
+        return base
+
+    def subst_basename(self, args: list[Word]) -> str:
+        if len(args) != 1 or (literal_word(args[0]) or "").startswith("-"):
+            return None
+        self.os_import = True
+        code = self.translate_word(args[0])
+        return "(os.path.basename({0}.rstrip('/')) or {0}[:1])".format(code)
+
+    def fold_dirname(args: list[str]) -> str:
+        if len(args) != 1 or args[0].startswith("-"):
+            return None
+        return os.path.dirname(args[0].rstrip("/") or args[0][:1]) or "."
+
+    def subst_dirname(self, args: list[Word]) -> str:
+        if len(args) != 1 or (literal_word(args[0]) or "").startswith("-"):
+            return None
+        self.os_import = True
+        code = self.translate_word(args[0])
+        return "(os.path.dirname({0}.rstrip('/') or {0}[:1]) or '.')".format(code)
+
+    # pure commands: name -> (fold literal arguments, inline expression)
+    substs = {
+        "echo": (fold_echo, subst_echo),
+        "printf": (None, subst_printf),
+        "basename": (fold_basename, subst_basename),
+        "dirname": (fold_dirname, subst_dirname),
+    }
+
+    # --native-coreutils: commands run by functions of the program itself,
+    # for the flag combinations parse_flags accepts; each returns a call
+    # giving the exit status, or None to run the command
+
+    def words_code(self, words: list[Word]) -> str:
+        return "[{}]".format(", ".join(map(self.translate_word, words)))
+
+    def native_rm(self, cmd: list[Word]) -> str:
+        if (parsed := parse_flags(cmd[1:], "f")) == None:
+            return None
+        flags, operands = parsed
+        if len(operands) == 0 and "f" not in flags:
+            return None
+        self.use_helper("sh_rm")
+        force = ", force=True" if "f" in flags else ""
+        return "sh_rm({}{})".format(self.words_code(operands), force)
+
+    def native_mkdir(self, cmd: list[Word]) -> str:
+        if (parsed := parse_flags(cmd[1:], "p")) == None or len(parsed[1]) == 0:
+            return None
+        flags, operands = parsed
+        self.use_helper("sh_mkdir")
+        parents = ", parents=True" if "p" in flags else ""
+        return "sh_mkdir({}{})".format(self.words_code(operands), parents)
+
+    def native_cat(self, cmd: list[Word]) -> str:
+        if (parsed := parse_flags(cmd[1:], "")) == None:
+            return None
+        self.use_helper("sh_cat")
+        return "sh_cat({})".format(self.words_code(parsed[1]))
+
+    def native_ls(self, cmd: list[Word]) -> str:
+        if (parsed := parse_flags(cmd[1:], "1")) == None or len(parsed[1]) > 1:
+            return None
+        self.use_helper("sh_ls")
+        return "sh_ls({})".format(self.words_code(parsed[1]))
+
+    def native_fgrep(self, cmd: list[Word]) -> str:
+        if (parsed := parse_flags(cmd[1:], "xq")) == None or len(parsed[1]) == 0:
+            return None
+        flags, operands = parsed
+        self.use_helper("sh_fgrep")
+        opts = ", line=True" if "x" in flags else ""
+        opts += ", quiet=True" if "q" in flags else ""
+        pattern = self.translate_word(operands[0])
+        return "sh_fgrep({}, {}{})".format(pattern, self.words_code(operands[1:]), opts)
+
+    def native_wc(self, cmd: list[Word]) -> str:
+        if (parsed := parse_flags(cmd[1:], "l")) == None:
+            return None
+        flags, operands = parsed
+        if flags != {"l"} or len(operands) > 1:
+            return None
+        self.use_helper("sh_wc_l")
+        return "sh_wc_l({})".format(self.translate_word(operands[0]) if operands else "")
+
+    # printed like their command substitution, statements only
+    def native_path(self, cmd: list[Word]) -> str:
+        fold, inline = Translator.substs[cmd[0].str]
+        args = [literal_word(w) for w in cmd[1:]]
+        if None not in args and (value := fold(args)) != None:
+            return "print({})".format(repr(value))
+        if (code := inline(self, cmd[1:])) != None:
+            return "print({})".format(code)
+        return None
+
+    # name -> (translation, gives an exit status)
+    coreutils = {
+        "rm": (native_rm, True),
+        "mkdir": (native_mkdir, True),
+        "cat": (native_cat, True),
+        "ls": (native_ls, True),
+        "fgrep": (native_fgrep, True),
+        "wc": (native_wc, True),
+        "basename": (native_path, False),
+        "dirname": (native_path, False),
+    }
+
+    # operand of an integer comparison, or None when it is not known to be
+    # an integer and has to be checked as it is compared
+    def translate_int_word(self, word: Word) -> str:
+        if (value := literal_word(word)) != None and re.fullmatch(r'-?\d+', value):
+            return str(int(value))
+        if (m := re.fullmatch(r'"?\$(\w+|#)"?|"?\${(\w+)}"?', word.str)) != None:
+            name = m.group(1) or m.group(2)
+            if name == "#" or self.is_int_var(name):
+                return self.translate_arith(ArithVarExp(name))
+            return None
+        if (arith := Arith.parse_word(word.str)) != None:
+            return self.translate_arith(arith)
+        return None
+
+    # operand of an integer comparison as the string it expands to
+    def translate_int_str(self, word: Word) -> str:
+        if (m := re.fullmatch(r'"?\$(\w+|#)"?|"?\${(\w+)}"?', word.str)) != None:
+            word = Word("$" + (m.group(1) or m.group(2)))
+        return self.translate_word(word)
+
+    # operators of each precedence level, tighter binding last
+    arith_levels = [("+", "-"), ("*", "/", "%")]
+
+    def arith_prec(exp: ArithExp) -> int:
+        # / and % are translated to calls, unless folded
+        if isinstance(exp, ArithBinExp) and exp.op in ("/", "%") \
+                and Translator.fold_arith(exp) == None:
+            return len(Translator.arith_levels) + 1
+        if isinstance(exp, ArithBinExp):
+            return next(i for i, ops in enumerate(Translator.arith_levels) if exp.op in ops)
+        if isinstance(exp, ArithNegExp):
+            return len(Translator.arith_levels)
+        return len(Translator.arith_levels) + 1
+
+    # value of arithmetic on constants, dividing the way the shell does
+    def fold_arith(exp: ArithExp) -> int:
+        if isinstance(exp, ArithNumExp):
+            return exp.value
+        if isinstance(exp, ArithNegExp):
+            if (value := Translator.fold_arith(exp.exp)) == None:
+                return None
+            return -value
+        if not isinstance(exp, ArithBinExp):
+            return None
+        lhs = Translator.fold_arith(exp.lhs)
+        rhs = Translator.fold_arith(exp.rhs)
+        if lhs == None or rhs == None:
+            return None
+        if exp.op == "+":
+            return lhs + rhs
+        if exp.op == "-":
+            return lhs - rhs
+        if exp.op == "*":
+            return lhs * rhs
+        if rhs == 0:
+            return None
+        q = abs(lhs) // abs(rhs) * (1 if (lhs < 0) == (rhs < 0) else -1)
+        if exp.op == "/":
+            return q
+        return lhs - q * rhs
+
+    def translate_arith(self, exp: ArithExp) -> str:
+        if isinstance(exp, ArithNumExp):
+            return str(exp.value)
+        if isinstance(exp, ArithVarExp):
+            if exp.name == "#":
+                self.sys_import = True
+                return "len(sys.argv[1:])"
+            if re.fullmatch(r'\d+', exp.name):
+                self.sys_import = True
+                return "int(sys.argv[{}])".format(exp.name)
+            if self.is_int_var(exp.name):
+                return exp.name
+            return "int({})".format(exp.name)
+        prec = Translator.arith_prec(exp)
+        if isinstance(exp, ArithNegExp):
+            code = self.translate_arith(exp.exp)
+            if Translator.arith_prec(exp.exp) < prec:
+                code = "({})".format(code)
+            return "-" + code
+        if (value := Translator.fold_arith(exp)) != None:
+            return str(value)
+        if exp.op in ("/", "%"):
+            # Python's // and % round toward negative infinity
+            self.use_helper("sh_div")
+            fn = "sh_div" if exp.op == "/" else "sh_mod"
+            return "{}({}, {})".format(fn, self.translate_arith(exp.lhs), self.translate_arith(exp.rhs))
+        code_lhs = self.translate_arith(exp.lhs)
+        if Translator.arith_prec(exp.lhs) < prec:
+            code_lhs = "({})".format(code_lhs)
+        code_rhs = self.translate_arith(exp.rhs)
+        # left associative, so an equal level on the right keeps its parens
+        if Translator.arith_prec(exp.rhs) <= prec:
+            code_rhs = "({})".format(code_rhs)
+        return "{} {} {}".format(code_lhs, exp.op, code_rhs)
+
+    def emit_if(self, exp: IfExp, indent: int, out: list[str]) -> None:
+        iffmt = "if {}:\n"
+        pred_str = self.translate_pred(exp.pred[0])
+        out.append(iffmt.format(pred_str))
+        self.emit_sequence(exp.branch[0], indent+1, out)
+        shift_str = indent * 4 * " "
+        eliffmt = shift_str + "elif {}:\n"
+        for i in range(1, len(exp.pred)):
+            pred_str = self.translate_pred(exp.pred[i])
+            out.append(eliffmt.format(pred_str))
+            self.emit_sequence(exp.branch[i], indent+1, out)
+        if len(exp.branch) > len(exp.pred): # else
+            out.append(shift_str + "else:\n")
+            self.emit_sequence(exp.branch[-1], indent+1, out)
+
+    def emit_while(self, exp: WhileExp, indent: int, out: list[str]) -> None:
+        inner, loop = self.begin_loop(exp, indent, out)
+        stdin = self.stdin
+        if len(exp.redirects) > 0:
+            # done < file: the loop's reads come from the file
+            self.handles += 1
+            self.stdin = f"_sheepy_in{self.handles}"
+            path = self.translate_word(exp.redirects[0][1])
+            out.append(f"with open({path}) as {self.stdin}:\n" + (inner + 1) * 4 * " ")
+            inner += 1
+        self.loops += 1
+        if (var := Translator.read_var(exp.pred)) != None:
+            self.emit_read_loop(exp, var, inner, out)
+        else:
             fmt = "while {}:\n"
             pred_str = self.translate_pred(exp.pred)
-            header = fmt.format(pred_str)
-            body = self.translate_sequence(exp.body, indent+1)
-            code = header + body
-            return code
-        return ""
+            out.append(fmt.format(pred_str))
+            self.emit_sequence(exp.body, inner+1, out)
+            # the condition runs again after the body
+            if self.hoisted and Translator.runs_external(exp):
+                Translator.end_line(out)
+                shift_str = (inner + 1) * 4 * " "
+                out.append("".join(shift_str + line + "\n" for line in self.flush_code()))
+        self.loops -= 1
+        self.stdin = stdin
+        self.end_loop(indent, out, loop)
+
+    # the variable of a read condition, when it is one
+    def read_var(pred: TestExp) -> str:
+        if CmdTestExp.is_cmd_test_exp(pred) and len(pred.redirects) == 0 \
+                and len(pred.cmd) == 2 and pred.cmd[0].str == "read" \
+                and re.fullmatch(r'[A-Za-z_]\w*', pred.cmd[1].str):
+            return pred.cmd[1].str
+        return None
+
+    # while read var: a loop over the lines of the input when nothing else
+    # in it reads, or else a readline per iteration; a last line with no
+    # newline sets var but ends the loop, as read fails at end of file
+    def emit_read_loop(self, exp: WhileExp, var: str, indent: int, out: list[str]) -> None:
+        if self.stdin == "sys.stdin":
+            self.sys_import = True
+        shift_str = (indent + 1) * 4 * " "
+        readline = any(ReadExp.is_read_exp(e) or not isinstance(e, (IfExp, WhileExp))
+                       and Translator.runs_external(e) for e in walk(exp.body))
+        if readline:
+            out.append(f"while ({var} := {self.stdin}.readline()).endswith('\\n'):\n")
+        else:
+            out.append(f"for {var} in {self.stdin}:\n")
+            out.append(f"{shift_str}if not {var}.endswith('\\n'):\n")
+            out.append(f"{shift_str}    {var} = {var}.strip(' \\t')\n")
+            out.append(f"{shift_str}    break\n")
+        out.append(f"{shift_str}{var} = {var}.strip(' \\t\\n')\n")
+        self.emit_sequence(exp.body, indent+1, out)
+        # at end of file: the partial last line, stripped as in the body, or
+        # nothing, as read leaves var empty
+        Translator.end_line(out)
+        out.append(indent * 4 * " " + "else:\n")
+        if readline:
+            out.append(f"{shift_str}{var} = {var}.strip(' \\t')\n")
+        else:
+            out.append(f"{shift_str}{var} = ''\n")
+
+    # start a loop: the globs and file tests that give the same result on
+    # every iteration are computed once before it, and the targets it
+    # appends to that stay the same in it are opened on first use, written
+    # through one buffered handle and closed after it, in a try at the
+    # indent returned; end_loop finishes it. Not a wrapper around the
+    # loop's emitter, which would add frames to every level of nesting
+    def begin_loop(self, exp: Exp, indent: int, out: list[str]) -> tuple[int, tuple]:
+        # the code of each, with none of the enclosing loops' names in it
+        outer = self.invariants
+        self.invariants = {}
+        codes = []
+        for node in self.loop_invariants(exp):
+            if GlobExp.is_glob_exp(node):
+                code = self.glob_call(self.translate_value(node.str))
+            elif isinstance(node, (FileTypeTestExp, FileAccessTestExp)):
+                code = self.translate_pred(node)
+            else:
+                code = self.glob_call(f'"{node.str}"')
+            if code not in outer and code not in codes:
+                codes.append(code)
+        self.invariants = outer
+        for code in codes:
+            self.invariants[code] = None
+        start = len(out)
+        targets = [w for w in self.loop_appends(exp) if w.str not in self.hoisted]
+        if len(targets) == 0:
+            return (indent, (start, codes, targets, []))
+        shift_str = indent * 4 * " "
+        names = []
+        for word in targets:
+            self.handles += 1
+            name = f"_sheepy_out{self.handles}"
+            names.append(name)
+            self.hoisted[word.str] = (name, self.translate_word(word))
+            out.append(f"{name} = None\n{shift_str}")
+        out.append("try:\n" + shift_str + "    ")
+        return (indent + 1, (start, codes, targets, names))
+
+    # close the handles of a loop begun at indent, and put the invariants
+    # its code used before it
+    def end_loop(self, indent: int, out: list[str], loop: tuple) -> None:
+        start, codes, targets, names = loop
+        shift_str = indent * 4 * " "
+        if len(targets) > 0:
+            Translator.end_line(out)
+            out.append(shift_str + "finally:\n")
+            for word, name in zip(targets, names):
+                out.append(f"{shift_str}    if {name} is not None:\n")
+                out.append(f"{shift_str}        {name}.close()\n")
+                del self.hoisted[word.str]
+        lines = []
+        for code in codes:
+            if (name := self.invariants.pop(code)) != None:
+                lines.append(f"{name} = {code}\n{shift_str}")
+        out[start:start] = lines
+
+    # globs and file tests in a loop whose result cannot change while it
+    # runs: the loop changes no directory, runs no other program, writes
+    # nothing in the directory they look at, and assigns none of their
+    # variables; a for loop's own list is left alone as it is read once
+    def loop_invariants(self, exp: Exp) -> list[object]:
+        nodes = list(walk([exp]))
+        assigned = set()
+        writes = []
+        for node in nodes:
+            if CdExp.is_cd_exp(node):
+                return []
+            if isinstance(node, (CmdExp, CmdTestExp)) and len(node.cmd) > 0 \
+                    and self.native_coreutils and node.cmd[0].str in Translator.coreutils:
+                name = node.cmd[0].str
+                if name in ("rm", "mkdir"):
+                    writes.extend(w.str for w in node.cmd[1:] if not w.str.startswith("-"))
+                if any('`' in w.str or '$(' in w.str for w in node.cmd):
+                    return []
+            elif not isinstance(node, (IfExp, WhileExp)) and Translator.runs_external(node):
+                return []
+            if AssignExp.is_assign_exp(node):
+                assigned.add(node.name)
+            elif ForExp.is_for_exp(node):
+                assigned.add(node.var.str)
+            elif ReadExp.is_read_exp(node) and node.arg != None:
+                assigned.add(node.arg.str)
+            if isinstance(node, (EchoExp, CmdExp, CmdTestExp)):
+                writes.extend(target.str for op, target in node.redirects
+                              if target != None and op != "<")
+        candidates = []
+        for node in nodes:
+            if isinstance(node, (FileTypeTestExp, FileAccessTestExp)):
+                candidates.append((node, node.file.str))
+            elif AssignExp.is_assign_exp(node):
+                candidates.extend((e, "".join(w.str for w in e.str.list))
+                                  for e, t in node.value.list if GlobExp.is_glob_exp(e))
+            words = []
+            if EchoExp.is_echo_exp(node):
+                words = node.args
+            elif CmdExp.is_cmd_exp(node):
+                words = node.cmd
+            elif ForExp.is_for_exp(node) and node is not exp:
+                words = node.iter
+            candidates.extend((w, w.str) for w in words if not SQuote.is_squote(w)
+                              and not DQuote.is_dquote(w) and '$' not in w.str
+                              and is_glob_str(w.str))
+        invariants = []
+        for node, path in candidates:
+            if any(name in assigned for name in re.findall(r'\$\{?(\w+)', path)):
+                continue
+            if '`' in path or '$(' in path:
+                continue
+            if any(Translator.may_touch(path, target) for target in writes):
+                continue
+            invariants.append(node)
+        return invariants
+
+    # whether writing target may change what a glob or test of path sees
+    def may_touch(path: str, target: str) -> bool:
+        if '$' in path or '$' in target or '`' in target:
+            return True
+        directory = os.path.dirname(path)
+        if is_glob_str(directory) or is_glob_str(target):
+            return True
+        return os.path.normpath(directory or ".") == os.path.normpath(os.path.dirname(target) or ".")
+
+    def end_line(out: list[str]) -> None:
+        for code in reversed(out):
+            if code != "":
+                if not code.endswith("\n"):
+                    out.append("\n")
+                return
+
+    def flush_code(self) -> list[str]:
+        return [f"if {name} is not None: {name}.flush()" for name, path in self.hoisted.values()]
+
+    # >> targets of a loop that can be kept open across iterations: the
+    # path does not change in the loop, nothing in it truncates the file
+    # and no command that might write it names it
+    def loop_appends(self, exp: Exp) -> list[Word]:
+        nodes = list(walk([exp]))
+        assigned = set()
+        appends: dict[str, Word] = {}
+        other = set()
+        named = set()
+        for node in nodes:
+            if CdExp.is_cd_exp(node):
+                return []
+            if AssignExp.is_assign_exp(node):
+                assigned.add(node.name)
+            elif ForExp.is_for_exp(node):
+                assigned.add(node.var.str)
+            elif ReadExp.is_read_exp(node) and node.arg != None:
+                assigned.add(node.arg.str)
+            if isinstance(node, (EchoExp, CmdExp, CmdTestExp)):
+                for op, target in node.redirects:
+                    if target == None:
+                        continue
+                    if op.endswith(">>"):
+                        appends.setdefault(target.str, target)
+                    elif op != "<":
+                        other.add(target.str)
+            if isinstance(node, (CmdExp, CmdTestExp)) and len(node.cmd) > 0 \
+                    and node.cmd[0].str not in reader_commands:
+                named.update(w.str for w in node.cmd)
+        targets = []
+        for key, word in appends.items():
+            if key in other or key in named or is_glob_str(key):
+                continue
+            if '`' in key or '$(' in key:
+                continue
+            if any(name in assigned for name in re.findall(r'\$\{?(\w+)', key)):
+                continue
+            targets.append(word)
+        return targets
+
+    # whether the statement itself may run another process, which has to
+    # see what was written to the hoisted handles
+    def runs_external(exp: Exp) -> bool:
+        words = []
+        if isinstance(exp, (CmdExp, CmdTestExp)):
+            if len(exp.cmd) == 0:
+                return False
+            name = exp.cmd[0].str
+            if name not in Translator.builtins and name not in Translator.builtin_preds:
+                return True
+            words = exp.cmd
+        elif EchoExp.is_echo_exp(exp):
+            words = exp.args
+        elif ForExp.is_for_exp(exp):
+            words = exp.iter
+        elif AssignExp.is_assign_exp(exp):
+            return any(CmdSubstExp.is_cmd_subst_exp(e) for e, t in exp.value.list)
+        elif IfExp.is_if_exp(exp):
+            return any(Translator.runs_external(p) for p in walk(exp.pred))
+        elif WhileExp.is_while_exp(exp):
+            return any(Translator.runs_external(p) for p in walk([exp.pred]))
+        elif isinstance(exp, (PipelineExp, PipelineTestExp, BackgroundExp)):
+            return True
+        return any('`' in w.str or '$(' in w.str for w in words)
 
     def translate_cmd(self, exp: Exp) -> str:
         if CmdExp.is_cmd_exp(exp):
-            self.subprocess_import = True
-            fmt = "subprocess.call([{}])"
+            if len(exp.cmd) > 0 and len(exp.redirects) == 0 \
+                    and (builtin := Translator.builtins.get(exp.cmd[0].str)) != None:
+                if (code := builtin(self, exp.cmd)) != None:
+                    return code
+            if self.native_coreutils and len(exp.cmd) > 0 and len(exp.redirects) == 0 \
+                    and (native := Translator.coreutils.get(exp.cmd[0].str)) != None:
+                if (code := native[0](self, exp.cmd)) != None:
+                    return code
+            prefix, items, streams = self.translate_redirects(exp.redirects)
+            # only the redirections, which create or truncate the files
+            if len(exp.cmd) == 0:
+                return self.join_redirected(prefix, items, "pass")
             args: list[str] = list(map(self.translate_word, exp.cmd))
-            code = fmt.format(", ".join(args))
-            return code
+            code = self.call_code(args, streams)
+            return self.join_redirected(prefix, items, code)
         return ""
 
-if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("usage: sheepy.py FILE")
-        exit(0)
-    filename = sys.argv[1]
-    with open(filename) as f:
-        lexer = Lexer(f.read())
+    # cmd &: started and entered in the job table, with no wait
+    def translate_background(self, exp: BackgroundExp) -> str:
+        self.use_jobs()
+        prefix, items, streams = self.translate_redirects(exp.cmd.redirects)
+        args: list[str] = list(map(self.translate_word, exp.cmd.cmd))
+        name = "sh_spawn_async" if self.async_jobs else "sh_spawn"
+        code = "{}([{}]{})".format(name, ", ".join(args), Translator.stream_args(streams))
+        return self.join_redirected(prefix, items, code)
+
+    def use_jobs(self) -> None:
+        self.use_helper("sh_jobs_async" if self.async_jobs else "sh_jobs")
+        self.use_helper("sh_last")
+
+    def translate_pipeline(self, exp: PipelineExp) -> str:
+        prefix, items, code = self.pipeline_code(exp)
+        return self.join_redirected(prefix, items, code)
+
+    # call of sh_pipeline; redirections of the first stage's input and the
+    # last stage's output apply to the whole pipeline
+    def pipeline_code(self, exp: PipelineExp, inline: bool = False) -> tuple[list[str], list[str], str]:
+        self.use_helper("sh_pipeline")
+        prefix, items, stages = [], [], []
+        kwargs = ""
+        last = len(exp.stages) - 1
+        for i, stage in enumerate(exp.stages):
+            p, w, streams = self.translate_redirects(stage.redirects, inline)
+            prefix += p
+            items += w
+            if "stdin" in streams and i == 0:
+                kwargs += ", stdin={}".format(streams.pop("stdin"))
+            if "stdout" in streams and i == last:
+                kwargs += ", stdout={}".format(streams.pop("stdout"))
+            if len(stage.redirects) == 0 and (gen := self.stage_builtin(stage)) != None:
+                stages.append(gen)
+                continue
+            words = stage.args if EchoExp.is_echo_exp(stage) else stage.cmd
+            if EchoExp.is_echo_exp(stage):
+                words = [Word("echo")] + words
+            argv = "[{}]".format(", ".join(map(self.translate_word, words)))
+            if len(streams) > 0:
+                redirects = ", ".join(f"'{k}': {v}" for k, v in streams.items())
+                argv = "({}, {{{}}})".format(argv, redirects)
+            stages.append(argv)
+        return (prefix, items, "sh_pipeline({}{})".format(", ".join(stages), kwargs))
+
+    # a builtin stage as a function returning its output
+    def stage_builtin(self, stage: Exp) -> str:
+        if EchoExp.is_echo_exp(stage):
+            args = stage.args
+        elif len(stage.cmd) > 0 and stage.cmd[0].str == "echo":
+            args = stage.cmd[1:]
+        elif len(stage.cmd) == 1 and stage.cmd[0].str in ("true", ":"):
+            return "lambda: []"
+        elif len(stage.cmd) == 1 and stage.cmd[0].str == "pwd":
+            self.os_import = True
+            return "lambda: [os.getcwd() + '\\n']"
+        elif len(stage.cmd) > 0 and stage.cmd[0].str == "printf":
+            if (code := self.printf_code(stage.cmd)) == None:
+                return None
+            return "lambda: [{}]".format(code)
+        else:
+            return None
+        code_args: list[str] = list(map(self.translate_word, args))
+        if len(code_args) == 1:
+            return "lambda: [{} + '\\n']".format(code_args[0])
+        return "lambda: [' '.join([{}]) + '\\n']".format(", ".join(code_args))
+
+    def stream_args(streams: dict[str, str]) -> str:
+        return "".join(f", {stream}={handle}" for stream, handle in streams.items())
+
+    # builtins run in process instead of spawning a command; each gets
+    # the command words and returns the code, or None when it has to
+    # fall back to running the command
+
+    # exit status is not kept, so these only matter for their output
+    def builtin_nop(self, cmd: list[Word]) -> str:
+        return "pass"
+
+    # test and [ are silent unless the expression is malformed, or an
+    # operand of an integer comparison is not an integer
+    def builtin_test(self, cmd: list[Word]) -> str:
+        parser = Parser(cmd)
+        if (testexp := parser.parse_pred_test()) == None or not parser.pos_out_of_range():
+            return None
+        if any(Word.is_word(w) and w.str in test_int_cmp_operators for w in cmd):
+            return self.translate_pred(testexp)
+        return "pass"
+
+    # test or [ in an and-or list, the condition it would be after if
+    def pred_test(self, cmd: list[Word]) -> str:
+        parser = Parser(cmd)
+        if (testexp := parser.parse_pred_test()) == None or not parser.pos_out_of_range():
+            return None
+        return self.translate_pred(testexp)
+
+    def builtin_pwd(self, cmd: list[Word]) -> str:
+        if len(cmd) > 1:
+            return None
+        self.os_import = True
+        return "print(os.getcwd())"
+
+    # printf with a literal format of %s, %d and %% conversions, one
+    # argument per conversion; literal arguments are substituted here
+    def builtin_printf(self, cmd: list[Word]) -> str:
+        if (code := self.printf_code(cmd)) == None:
+            return None
+        return "print({}, end='')".format(code)
+
+    # expression for the output of printf
+    def printf_code(self, cmd: list[Word]) -> str:
+        if (parts := self.printf_format(cmd)) == None:
+            return None
+        fmt, code_args = parts
+        if len(code_args) == 0:
+            return repr(fmt % ())
+        elif len(code_args) == 1:
+            return "{} % {}".format(repr(fmt), code_args[0])
+        else:
+            return "{} % ({})".format(repr(fmt), ", ".join(code_args))
+
+    # printf as a format for % and the code of its arguments
+    def printf_format(self, cmd: list[Word]) -> tuple[str, list[str]]:
+        if len(cmd) < 2 or (fmt := literal_word(cmd[1])) == None:
+            return None
+        if (fmt := printf_unescape(fmt)) == None:
+            return None
+        parts = re.split(r'(%-?\d*[sd%])', fmt)
+        code_fmt = []
+        code_args = []
+        rest = cmd[2:]
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                # any other conversion
+                if "%" in part:
+                    return None
+                code_fmt.append(part)
+            elif part == "%%":
+                code_fmt.append("%%")
+            elif len(rest) == 0:
+                return None
+            elif (value := literal_word(rest[0])) != None:
+                if part[-1] == "d":
+                    if not re.fullmatch(r'-?\d+', value):
+                        return None
+                    value = int(value)
+                code_fmt.append((part % value).replace("%", "%%"))
+                rest = rest[1:]
+            elif part[-1] == "s":
+                code_fmt.append(part)
+                code_args.append(self.translate_word(rest[0]))
+                rest = rest[1:]
+            else:
+                return None
+        if len(rest) > 0:
+            return None
+        return ("".join(code_fmt), code_args)
+
+    # wait for every job, or for the given pids, whose status is that of
+    # the last one
+    def builtin_wait(self, cmd: list[Word]) -> str:
+        self.use_jobs()
+        name = "sh_wait_async" if self.async_jobs else "sh_wait"
+        return "{}({})".format(name, ", ".join(map(self.translate_word, cmd[1:])))
+
+    def pred_wait(self, cmd: list[Word]) -> str:
+        return "not " + self.builtin_wait(cmd)
+
+    def pred_true(self, cmd: list[Word]) -> str:
+        return "True"
+
+    def pred_false(self, cmd: list[Word]) -> str:
+        return "False"
+
+    builtins = {
+        "true": builtin_nop,
+        "false": builtin_nop,
+        ":": builtin_nop,
+        "test": builtin_test,
+        "[": builtin_test,
+        "pwd": builtin_pwd,
+        "printf": builtin_printf,
+        "wait": builtin_wait,
+    }
+
+    builtin_preds = {
+        "true": pred_true,
+        ":": pred_true,
+        "false": pred_false,
+        "test": pred_test,
+        "[": pred_test,
+        "wait": pred_wait,
+    }
+
+    # node type -> (method, ends the line, writes nested blocks into out)
+    emitters = {
+        NewlineExp: (translate_newline, True, False),
+        CommentExp: (translate_comment, False, False),
+        AssignExp: (translate_assign, True, False),
+        CdExp: (translate_cd, True, False),
+        ExitExp: (translate_exit, False, False),
+        ReadExp: (translate_read, False, False),
+        EchoExp: (translate_echo, False, False),
+        ForExp: (emit_for, False, True),
+        IfExp: (emit_if, False, True),
+        WhileExp: (emit_while, False, True),
+        CmdExp: (translate_cmd, False, False),
+        PipelineExp: (translate_pipeline, False, False),
+        BackgroundExp: (translate_background, False, False),
+    }
+
+    scanners = {
+        AssignExp: scan_assign,
+        CdExp: scan_cd,
+        ExitExp: scan_exit,
+        ReadExp: scan_read,
+        EchoExp: scan_echo,
+        ForExp: scan_for,
+        IfExp: scan_if,
+        WhileExp: scan_while,
+        CmdExp: scan_cmd,
+        PipelineExp: translate_pipeline,
+        BackgroundExp: translate_background,
+    }
+
+# the runtime module's source, whose "# helper:" sections are the code
+# pasted into programs that inline their helpers
+def runtime_path() -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "sheepy_rt.py")
+
+def load_runtime() -> dict[str, str]:
+    with open(runtime_path()) as f:
+        source = f.read()
+    sections = re.split(r'^# helper: (\w+)\n', source, flags=re.M)
+    return {name: "\n" + code.rstrip("\n") + "\n"
+            for name, code in zip(sections[1::2], sections[2::2])}
+
+runtime_helpers = load_runtime()
+
+# the public names a helper defines, for importing it from the module
+def runtime_names(name: str) -> list[str]:
+    return re.findall(r'^def ([a-z]\w*)', runtime_helpers[name], re.M)
+
+# the modules each helper needs imported when it is inlined
+runtime_imports = {
+    "sh_pipeline": ["os", "subprocess", "sys", "threading"],
+    "sh_parallel": ["concurrent.futures", "os", "subprocess", "sys"],
+    "sh_jobs": ["subprocess"],
+    "sh_jobs_async": ["asyncio"],
+    "sh_last": [],
+    "sh_glob": ["glob"],
+    "sh_test": ["os"],
+    "sh_div": [],
+    "sh_int_cmp": ["sys"],
+    "sh_call": ["subprocess", "sys"],
+    "sh_rm": ["os", "sys"],
+    "sh_mkdir": ["os", "sys"],
+    "sh_cat": ["shutil", "sys"],
+    "sh_ls": ["locale", "os", "subprocess", "sys"],
+    "sh_fgrep": ["os", "sys"],
+    "sh_wc_l": ["sys"],
+}
+
+# token iterator over a script file, mapped into memory where possible
+def stream_file(f) -> Iterator[Token]:
+    try:
+        source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError): # empty file or not mappable
+        source = f
+    return Lexer.stream(source)
+
+# translate a shell script, returning the Python code and its token count
+def transpile(source: str, options: dict = {}) -> tuple[str, int]:
+    token = Lexer(source).tokenize()
+    stmt = Parser(token).parse()
+    stmt = PassManager(options.get("opt_level", 0)).run(stmt)
+    return (Translator(stmt, **options).translate(), len(token))
+
+def default_cache_dir() -> str:
+    if (dir := os.environ.get("SHEEPY_CACHE_DIR")) != None:
+        return dir
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "sheepy")
+
+# translated programs stored under a hash of everything that determines
+# them; entries are touched on every hit and the least recently used are
+# evicted once the directory grows past max_bytes; a directory that cannot
+# be written is warned about once and then left alone
+class Cache:
+    def __init__(self, dir: str, max_bytes: int = 64 << 20) -> None:
+        self.dir = dir
+        self.max_bytes = max_bytes
+        self.size = None # bytes in dir, counted on the first store
+        self.failed = False
+
+    # the translator's own source is part of the key so that a changed
+    # sheepy.py never serves output of an older one under the same version
+    @functools.cache
+    def build_id() -> str:
+        h = hashlib.sha256()
+        for path in (__file__, runtime_path()):
+            with open(path, "rb") as f:
+                h.update(f.read())
+        return f"sheepy {__version__} {h.hexdigest()}"
+
+    def key(source: bytes, options: dict) -> str:
+        h = hashlib.sha256()
+        h.update(Cache.build_id().encode() + b"\0")
+        h.update(json.dumps(options, sort_keys=True).encode() + b"\0")
+        h.update(source)
+        return h.hexdigest()
+
+    # an entry is the program, key.py, or its code object marshalled for
+    # this Python, key.<cache tag>.code
+    def path(self, key: str, suffix: str = ".py") -> str:
+        return os.path.join(self.dir, key + suffix)
+
+    def code_suffix() -> str:
+        return f".{sys.implementation.cache_tag}.code"
+
+    def get(self, key: str) -> str:
+        try:
+            with open(self.path(key)) as f:
+                code = f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+        self.touch(self.path(key))
+        return code
+
+    def put(self, key: str, code: str) -> None:
+        self.store(self.path(key), code.encode())
+
+    def get_code(self, key: str) -> CodeType:
+        try:
+            with open(self.path(key, Cache.code_suffix()), "rb") as f:
+                code = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        self.touch(self.path(key, Cache.code_suffix()))
+        return code
+
+    def put_code(self, key: str, code: CodeType) -> None:
+        self.store(self.path(key, Cache.code_suffix()), marshal.dumps(code))
+
+    # mark an entry as recently used
+    def touch(self, path: str) -> None:
+        if self.failed:
+            return
+        try:
+            os.utime(path)
+        except OSError as e:
+            self.fail(e)
+
+    def store(self, path: str, data: bytes) -> None:
+        if self.failed:
+            return
+        tmp = None
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            tmp = None
+            if self.size == None:
+                self.size = self.evict()
+            else:
+                self.size += len(data)
+                if self.size > self.max_bytes:
+                    self.size = self.evict()
+        except OSError as e:
+            if tmp != None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+            self.fail(e)
+
+    # whether entries can be stored, checked before starting worker
+    # processes, which would each warn with their own copy of the cache
+    def writable(self) -> bool:
+        self.store(os.path.join(self.dir, "probe.tmp"), b"")
+        if not self.failed:
+            try:
+                os.remove(os.path.join(self.dir, "probe.tmp"))
+            except OSError:
+                pass
+        return not self.failed
+
+    def fail(self, e: OSError) -> None:
+        self.failed = True
+        eeprint(f"sheepy.py: not caching in {self.dir}: {e.strerror or e}")
+
+    # drop least recently used entries until the cache fits, return its size
+    def evict(self) -> int:
+        entries = []
+        for entry in os.scandir(self.dir):
+            if entry.name.endswith((".py", ".code")):
+                # entries another process evicted meanwhile are skipped
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        size = sum(e[1] for e in entries)
+        entries.sort()
+        for mtime, nbytes, path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= nbytes
+        return size
+
+    def transpile(self, source: bytes, options: dict = {}) -> tuple[str, int, bool]:
+        key = Cache.key(source, options)
+        if (code := self.get(key)) != None:
+            return (code, 0, True)
+        code, ntoken = transpile(source.decode(), options)
+        self.put(key, code)
+        return (code, ntoken, False)
+
+    # the compiled program, filename being what its tracebacks name
+    def compile(self, source: bytes, options: dict, filename: str) -> CodeType:
+        # the code object keeps its filename for tracebacks
+        key = Cache.key(source, dict(options, filename=filename))
+        if (code := self.get_code(key)) != None:
+            return code
+        program, ntoken, cached = self.transpile(source, options)
+        code = compile(program, filename, "exec")
+        self.put_code(key, code)
+        return code
+
+# (source, destination) pairs for --batch: scripts found under a directory
+# keep their path relative to it, scripts named directly go to the top
+def batch_files(paths: list[str], out_dir: str) -> list[tuple[str, str]]:
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            name = os.path.splitext(os.path.basename(path))[0] + ".py"
+            files.append((path, os.path.join(out_dir, name)))
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                if not name.endswith(".sh"):
+                    continue
+                src = os.path.join(root, name)
+                rel = os.path.splitext(os.path.relpath(src, path))[0] + ".py"
+                files.append((src, os.path.join(out_dir, rel)))
+    return files
+
+batch_cache: Cache = None
+
+def batch_init(cache: Cache) -> None:
+    global batch_cache
+    batch_cache = cache
+
+# transpile through the worker's cache if it has one
+def cached_transpile(source: bytes, options: dict) -> tuple[str, int, bool]:
+    if batch_cache != None:
+        return batch_cache.transpile(source, options)
+    code, ntoken = transpile(source.decode(), options)
+    return (code, ntoken, False)
+
+# runs in a worker process; errors are returned so one bad script does
+# not stop the batch
+def batch_job(src: str, dst: str, options: dict) -> tuple[str, int, bool, str]:
+    try:
+        with open(src, "rb") as f:
+            source = f.read()
+        code, ntoken, cached = cached_transpile(source, options)
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        with open(dst, "w") as f:
+            print(code, file=f)
+        return (src, ntoken, cached, None)
+    except Exception as e:
+        return (src, 0, False, f"{type(e).__name__}: {e}")
+
+def run_batch(files: list[tuple[str, str]], jobs: int, cache: Cache = None,
+              options: dict = {}) -> int:
+    dsts = [dst for src, dst in files]
+    if len(set(dsts)) != len(dsts):
+        dup = next(dst for dst in dsts if dsts.count(dst) > 1)
+        eeprint(f"sheepy.py: more than one script would be written to {dup}")
+        return 1
+    srcs = [src for src, dst in files]
+    if cache != None and not cache.writable():
+        cache = None
+    start = time.perf_counter()
+    failed = 0
+    hits = 0
+    ntoken = 0
+    with concurrent.futures.ProcessPoolExecutor(jobs, initializer=batch_init,
+                                                initargs=(cache,)) as pool:
+        chunksize = max(1, len(files) // (jobs * 4))
+        results = pool.map(batch_job, srcs, dsts, itertools.repeat(options),
+                           chunksize=chunksize)
+        for src, n, cached, err in results:
+            if err != None:
+                eeprint(f"{src}: {err}")
+                failed += 1
+            hits += cached
+            ntoken += n
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    eeprint(f"{len(files)} files ({hits} cached), {failed} failed in {elapsed:.2f}s: "
+            f"{len(files) / elapsed:.1f} files/s, {ntoken / elapsed:.0f} tokens/s")
+    return 1 if failed else 0
+
+# __main__ of a bundle: runs the program named by the link the bundle is
+# invoked through, or by its first argument, from its precompiled code
+bundle_main = """\
+import io
+import marshal
+import sys
+
+scripts = {scripts!r}
+
+name = sys.argv[0].rsplit("/", 1)[-1]
+if name not in scripts:
+    if len(sys.argv) < 2 or sys.argv[1] not in scripts:
+        sys.exit(f"usage: {{sys.argv[0]}} SCRIPT [ARG]...\\nscripts: {{' '.join(scripts)}}")
+    name = sys.argv.pop(1)
+sys.argv[0] = name
+# the programs are written for python3 -u
+for stream in ("stdout", "stderr"):
+    if (f := getattr(sys, stream)) != None and not f.write_through:
+        raw = io.FileIO(f.fileno(), "w", closefd=False)
+        setattr(sys, stream, io.TextIOWrapper(raw, f.encoding, f.errors, write_through=True))
+code = marshal.loads(__loader__.get_data(f"scripts/{{name}}.pyc")[16:])
+exec(code, {{"__name__": "__main__", "__builtins__": __builtins__}})
+"""
+
+# translate the scripts as --batch does, compile the programs to bytecode
+# and store them, with sheepy_rt if they import it, in a zipapp at path
+def run_bundle(paths: list[str], path: str, jobs: int, cache: Cache = None,
+               options: dict = {}) -> int:
+    with tempfile.TemporaryDirectory() as dir:
+        files = batch_files(paths, os.path.join(dir, "scripts"))
+        if (status := run_batch(files, jobs, cache, options)) != 0:
+            return status
+        members = [(dst, os.path.relpath(dst, dir)) for src, dst in files]
+        if options.get("runtime") == "import":
+            members.append((runtime_path(), "sheepy_rt.py"))
+        scripts = []
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"#!/usr/bin/python3 -u\n")
+            with zipfile.ZipFile(f, "w") as z:
+                for src, name in members:
+                    name = os.path.splitext(name)[0].replace(os.sep, "/")
+                    cfile = os.path.join(dir, "code.pyc")
+                    try:
+                        py_compile.compile(src, cfile, name + ".py", doraise=True,
+                                           invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+                    except py_compile.PyCompileError as e:
+                        eeprint(f"sheepy.py: {e.msg}")
+                        os.unlink(tmp)
+                        return 1
+                    z.write(cfile, name + ".pyc")
+                    if name.startswith("scripts/"):
+                        scripts.append(name[len("scripts/"):])
+                z.writestr("__main__.py", bundle_main.format(scripts=scripts))
+        os.chmod(tmp, 0o755)
+        os.replace(tmp, path)
+    return 0
+
+# --serve: the daemon's half of the wire format in sheepy_client.py
+def serve_job(source: bytes, options: dict) -> str:
+    return cached_transpile(source, options)[0]
+
+class ServeHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        while (options := recv_frame(self.rfile)) != None:
+            if (source := recv_frame(self.rfile)) == None:
+                return
+            self.server.begin()
+            try:
+                code = self.server.translate(source, json.loads(options))
+                reply = b"0" + code.encode()
+            except Exception as e:
+                reply = b"1" + f"{type(e).__name__}: {e}".encode()
+            finally:
+                self.server.end()
+            send_frame(self.connection, reply)
+
+# warm translator process answering requests on a Unix socket, each
+# connection in its own thread, with translation in a pool of worker
+# processes when jobs > 1; shuts down after idle_timeout seconds without
+# a request in flight
+class TranspileServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, cache: Cache, jobs: int, idle_timeout: float) -> None:
+        super().__init__(path, ServeHandler)
+        if cache != None and not cache.writable():
+            cache = None
+        batch_init(cache)
+        self.pool = None
+        if jobs > 1:
+            self.pool = concurrent.futures.ProcessPoolExecutor(
+                jobs, initializer=batch_init, initargs=(cache,))
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.active = 0
+        self.last = time.monotonic()
+
+    def translate(self, source: bytes, options: dict) -> str:
+        if self.pool != None:
+            return self.pool.submit(serve_job, source, options).result()
+        return serve_job(source, options)
+
+    def begin(self) -> None:
+        with self.lock:
+            self.active += 1
+
+    def end(self) -> None:
+        with self.lock:
+            self.active -= 1
+            self.last = time.monotonic()
+
+    def watch_idle(self) -> None:
+        while True:
+            time.sleep(min(1.0, self.idle_timeout))
+            with self.lock:
+                idle = self.active == 0 and time.monotonic() - self.last >= self.idle_timeout
+            if idle:
+                self.shutdown()
+                return
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.pool != None:
+            self.pool.shutdown()
+
+def run_server(path: str, cache: Cache, jobs: int, idle_timeout: float) -> int:
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(path)
+            eeprint(f"sheepy.py: already serving on {path}")
+            return 1
+        except OSError: # stale socket of a daemon that died
+            os.unlink(path)
+        finally:
+            probe.close()
+    server = TranspileServer(path, cache, jobs, idle_timeout)
+    try:
+        threading.Thread(target=server.watch_idle, daemon=True).start()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+    return 0
+
+# options that change the generated program, and so are part of the key
+# of cached output
+def translation_options(args: argparse.Namespace) -> dict:
+    options = {}
+    if args.native_coreutils:
+        options["native_coreutils"] = True
+    if args.opt_level > 0:
+        options["opt_level"] = args.opt_level
+    if args.parallel_loops > 1:
+        options["parallel_loops"] = args.parallel_loops
+    if args.async_jobs:
+        options["async_jobs"] = True
+    if args.runtime != "inline":
+        options["runtime"] = "import"
+    return options
+
+# copy the runtime module into each directory programs are written to,
+# where they import it from, unless it is already there
+def vendor_runtime(dirs: list[str]) -> None:
+    with open(runtime_path(), "rb") as f:
+        source = f.read()
+    for dir in sorted(set(d or "." for d in dirs)):
+        dst = os.path.join(dir, "sheepy_rt.py")
+        if os.path.exists(dst):
+            with open(dst, "rb") as f:
+                if f.read() == source:
+                    continue
+        os.makedirs(dir, exist_ok=True)
+        with open(dst, "wb") as f:
+            f.write(source)
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(prog="sheepy.py")
+    ap.add_argument("file", metavar="FILE", nargs="*")
+    ap.add_argument("--batch", action="store_true",
+                    help="translate every FILE, and every *.sh under a "
+                         "directory FILE, into --out-dir")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                    help="worker processes for --batch and --serve")
+    ap.add_argument("--out-dir", metavar="DIR",
+                    help="output directory for --batch and --client")
+    ap.add_argument("--serve", metavar="SOCKET",
+                    help="run a translation daemon on a Unix socket")
+    ap.add_argument("--idle-timeout", metavar="SECONDS", type=float,
+                    default=600, help="stop --serve after this long idle")
+    ap.add_argument("--native-coreutils", action="store_true",
+                    help="run rm, mkdir, cat, ls, fgrep, wc, basename and "
+                         "dirname in the generated program")
+    ap.add_argument("--parallel-loops", metavar="N", type=int, default=0,
+                    help="run the iterations of for loops that only run "
+                         "commands on the loop variable on N threads")
+    ap.add_argument("--async", dest="async_jobs", action="store_true",
+                    help="run background jobs as asyncio subprocesses")
+    ap.add_argument("--client", metavar="SOCKET",
+                    help="translate FILEs through the daemon on SOCKET")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="always translate, bypassing the output cache")
+    ap.add_argument("--cache-dir", metavar="DIR", default=default_cache_dir(),
+                    help="directory of the output cache")
+    ap.add_argument("--cache-size", metavar="MB", type=int, default=64,
+                    help="size the output cache is trimmed to")
+    ap.add_argument("--lexer", choices=lexer_engines + ["compare"],
+                    default="cursor",
+                    help="lexer engine, or compare cursor against legacy")
+    ap.add_argument("--stream", action="store_true",
+                    help="write the output a statement at a time, holding "
+                         "neither the whole script nor its tree, at the cost "
+                         "of parsing it twice (once with -O or "
+                         "--parallel-loops, which keep the tree)")
+    ap.add_argument("-o", "--output", metavar="OUT",
+                    help="write the Python program to OUT, not stdout")
+    ap.add_argument("--parse-stats", action="store_true",
+                    help="report parser memo table hits on stderr")
+    ap.add_argument("-O", dest="opt_level", metavar="LEVEL", type=int,
+                    choices=range(3), default=0,
+                    help="optimisation level: 1 folds constant tests, prunes "
+                         "dead branches, code and imports; 2 also propagates "
+                         "constant variables")
+    ap.add_argument("--time-passes", action="store_true",
+                    help="report the time of each pass on stderr")
+    ap.add_argument("--bundle", metavar="OUT.pyz",
+                    help="translate every FILE as --batch does into a "
+                         "zipapp of precompiled programs, run as OUT.pyz "
+                         "SCRIPT ARG... or through a link named SCRIPT")
+    ap.add_argument("--run", metavar="SCRIPT", nargs=argparse.REMAINDER,
+                    help="translate SCRIPT and run it in this process with "
+                         "the arguments that follow it")
+    ap.add_argument("--runtime", choices=["inline", "import", "vendor"],
+                    default="inline",
+                    help="define the runtime helpers in each program, import "
+                         "them from sheepy_rt, or also copy sheepy_rt.py to "
+                         "the output directory")
+    args = ap.parse_args(argv)
+    cache = None
+    if not args.no_cache:
+        cache = Cache(args.cache_dir, args.cache_size << 20)
+    options = translation_options(args)
+    if args.serve != None:
+        if args.file:
+            ap.error("--serve takes no FILE")
+        return run_server(args.serve, cache, max(1, args.jobs), args.idle_timeout)
+    if args.run != None:
+        if not args.run:
+            ap.error("--run expects a SCRIPT")
+        if args.file or args.batch or args.bundle != None or args.client != None \
+                or args.stream or args.output != None:
+            ap.error("--run takes no FILE and does not combine with --batch, "
+                     "--bundle, --client, --stream or --output")
+        try:
+            return run_script(args.run[0], args.run[1:], cache, options)
+        except ParseError as e:
+            eeprint(f"{args.run[0]}: {e}")
+            return 2
+    if not args.file:
+        ap.error("expected a FILE")
+    if args.bundle != None:
+        if args.batch or args.client != None or args.stream or args.output != None \
+                or args.out_dir != None:
+            ap.error("--bundle does not combine with --batch, --client, --stream, "
+                     "--output or --out-dir")
+        return run_bundle(args.file, args.bundle, max(1, args.jobs), cache, options)
+    if args.batch:
+        if args.out_dir == None:
+            ap.error("--batch requires --out-dir")
+        if args.stream or args.output != None:
+            ap.error("--batch does not combine with --stream or --output")
+        files = batch_files(args.file, args.out_dir)
+        if args.runtime == "vendor":
+            vendor_runtime([os.path.dirname(dst) for src, dst in files])
+        return run_batch(files, max(1, args.jobs), cache, options)
+    if args.client != None:
+        if args.out_dir != None:
+            files = batch_files(args.file, args.out_dir)
+        elif len(args.file) == 1:
+            files = [(args.file[0], None)]
+        else:
+            ap.error("--client with more than one FILE requires --out-dir")
+        if args.runtime == "vendor":
+            if args.out_dir == None and args.output == None:
+                ap.error("--runtime vendor requires --output or --out-dir")
+            vendor_runtime([os.path.dirname(dst or args.output) for src, dst in files])
+        out = sys.stdout if args.output == None else open(args.output, "w")
+        try:
+            return run_client(args.client, files, options, out)
+        finally:
+            if out != sys.stdout:
+                out.close()
+    if len(args.file) != 1:
+        ap.error("expected exactly one FILE without --batch")
+    if args.stream and args.lexer != "cursor":
+        ap.error("--stream only supports the cursor lexer")
+    args.file = args.file[0]
+    if args.runtime == "vendor":
+        if args.output == None:
+            ap.error("--runtime vendor requires --output")
+        vendor_runtime([os.path.dirname(args.output)])
+    out = sys.stdout if args.output == None else open(args.output, "w")
+    try:
+        return translate_file(args, cache, options, out)
+    except ParseError as e:
+        eeprint(f"{args.file}: {e}")
+        return 2
+    finally:
+        if out != sys.stdout:
+            out.close()
+
+# --run: translate a script, compile the program and execute it in this
+# process, with the script and its arguments as sys.argv
+def run_script(path: str, argv: list[str], cache: Cache, options: dict) -> int:
+    try:
+        with open(path, "rb") as f:
+            source = f.read()
+    except OSError:
+        # as a shell does for a script it cannot open
+        eeprint(f"sheepy.py: cannot open {path}")
+        return 127
+    # tracebacks have lines of the program, not of the script
+    filename = f"<translated {path}>"
+    if cache != None:
+        code = cache.compile(source, options, filename)
+    else:
+        program, ntoken = transpile(source.decode(), options)
+        code = compile(program, filename, "exec")
+    sys.argv = [path] + argv
+    # the programs are written for python3 -u
+    for stream in ("stdout", "stderr"):
+        if not (f := getattr(sys, stream)).write_through:
+            raw = io.FileIO(f.fileno(), "w", closefd=False)
+            setattr(sys, stream, io.TextIOWrapper(raw, f.encoding, f.errors, write_through=True))
+    exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+    return 0
+
+def translate_file(args: argparse.Namespace, cache: Cache, options: dict, out) -> int:
+    if cache != None and not args.stream and args.lexer == "cursor" and not args.parse_stats \
+            and not args.time_passes:
+        with open(args.file, "rb") as f:
+            code, ntoken, cached = cache.transpile(f.read(), options)
+        print(code, file=out)
+        return 0
+    if args.stream and options.get("opt_level", 0) == 0 and options.get("parallel_loops", 0) <= 1:
+        # two parses, neither of which keeps the tree
+        parsers = []
+        def statements() -> Iterator[Exp]:
+            with open(args.file, "rb") as f:
+                parsers.append(Parser(stream_file(f)))
+                yield from parsers[-1].parse_iter()
+        start = time.perf_counter()
+        Translator([], **options).translate_stream(statements, out)
+        out.write("\n")
+        if args.parse_stats:
+            eeprint(f"{args.file}: {parsers[0].memo_hits} re-parses avoided, "
+                    f"{parsers[0].memo_misses} rules parsed")
+        if args.time_passes:
+            eeprint(f"{args.file}: translate {(time.perf_counter() - start) * 1000:.3f} ms")
+        return 0
+    if args.stream:
+        # the passes and parallel loops need the whole tree
+        with open(args.file, "rb") as f:
+            parser = Parser(stream_file(f))
+            stmt = list(parser.parse_iter())
+    else:
+        with open(args.file) as f:
+            source = f.read()
+        if args.lexer == "compare":
+            if (i := Lexer.compare(source)) != -1:
+                eeprint(f"{args.file}: lexers differ at token {i}")
+                return 1
+            args.lexer = "cursor"
+        lexer = Lexer(source, args.lexer)
         token = lexer.tokenize()
         eprint(token)
         parser = Parser(token)
         stmt = parser.parse()
-        translator = Translator(stmt)
+    if args.parse_stats:
+        eeprint(f"{args.file}: {parser.memo_hits} re-parses avoided, "
+                f"{parser.memo_misses} rules parsed")
+    passes = PassManager(options.get("opt_level", 0))
+    stmt = passes.run(stmt)
+    start = time.perf_counter()
+    translator = Translator(stmt, **options)
+    if args.stream:
+        translator.translate_to(out)
+        out.write("\n")
+    else:
         code = translator.translate()
-        print(code)
+        print(code, file=out)
+    if args.time_passes:
+        for name, seconds in passes.times + [("translate", time.perf_counter() - start)]:
+            eeprint(f"{args.file}: {name} {seconds * 1000:.3f} ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
 
 def repl_test(filename: str) -> tuple[list[Token], list[Exp]]:
     with open(filename) as f:
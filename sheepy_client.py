@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+# client of a sheepy.py --serve daemon: sends scripts over its Unix socket
+# and writes out the programs it replies with; it imports nothing of the
+# translator, so it starts as fast as Python does. sheepy.py imports only
+# the wire format and run_client from here, and keeps its own copies of
+# the command line helpers below
+import argparse
+import json
+import os
+import socket
+import sys
+
+# --serve/--client wire format: each request is a frame of JSON options
+# followed by a frame of script bytes, each reply a frame holding b"0" and
+# the program or b"1" and an error; a frame is a 4-byte big-endian length
+# and the payload
+
+def send_frame(sock: socket.socket, data: bytes) -> None:
+    sock.sendall(len(data).to_bytes(4, "big") + data)
+
+def recv_frame(f) -> bytes:
+    head = f.read(4)
+    if len(head) < 4:
+        return None
+    n = int.from_bytes(head, "big")
+    data = f.read(n)
+    if len(data) < n:
+        return None
+    return data
+
+# (source, destination) pairs for --batch: scripts found under a directory
+# keep their path relative to it, scripts named directly go to the top
+def batch_files(paths: list[str], out_dir: str) -> list[tuple[str, str]]:
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            name = os.path.splitext(os.path.basename(path))[0] + ".py"
+            files.append((path, os.path.join(out_dir, name)))
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                if not name.endswith(".sh"):
+                    continue
+                src = os.path.join(root, name)
+                rel = os.path.splitext(os.path.relpath(src, path))[0] + ".py"
+                files.append((src, os.path.join(out_dir, rel)))
+    return files
+
+# send each (source, destination) pair to a daemon over one connection;
+# a destination of None means stdout
+def run_client(path: str, files: list[tuple[str, str]], options: dict, out) -> int:
+    failed = 0
+    with socket.socket(socket.AF_UNIX) as sock:
+        try:
+            sock.connect(path)
+        except OSError as e:
+            print(f"sheepy.py: cannot connect to {path}: {e.strerror or e}", file=sys.stderr)
+            return 1
+        f = sock.makefile("rb")
+        opts = json.dumps(options).encode()
+        for src, dst in files:
+            try:
+                with open(src, "rb") as g:
+                    source = g.read()
+            except OSError:
+                print(f"sheepy.py: cannot open {src}", file=sys.stderr)
+                failed += 1
+                continue
+            try:
+                send_frame(sock, opts)
+                send_frame(sock, source)
+                reply = recv_frame(f)
+            except (BrokenPipeError, ConnectionResetError):
+                reply = None
+            if reply == None:
+                print(f"sheepy.py: {path}: connection closed", file=sys.stderr)
+                return 1
+            if reply[:1] != b"0":
+                print(f"{src}: {reply[1:].decode()}", file=sys.stderr)
+                failed += 1
+            elif dst == None:
+                print(reply[1:].decode(), file=out)
+            else:
+                os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+                with open(dst, "w") as g:
+                    print(reply[1:].decode(), file=g)
+    return 1 if failed else 0
+
+# copy the runtime module into each directory programs are written to,
+# where they import it from, unless it is already there
+def vendor_runtime(dirs: list[str]) -> None:
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sheepy_rt.py")
+    with open(path, "rb") as f:
+        source = f.read()
+    for dir in sorted(set(d or "." for d in dirs)):
+        dst = os.path.join(dir, "sheepy_rt.py")
+        if os.path.exists(dst):
+            with open(dst, "rb") as f:
+                if f.read() == source:
+                    continue
+        os.makedirs(dir, exist_ok=True)
+        with open(dst, "wb") as f:
+            f.write(source)
+
+# options that change the generated program, as sheepy.py's
+# translation_options sends them
+def translation_options(args: argparse.Namespace) -> dict:
+    options = {}
+    if args.native_coreutils:
+        options["native_coreutils"] = True
+    if args.opt_level > 0:
+        options["opt_level"] = args.opt_level
+    if args.parallel_loops > 1:
+        options["parallel_loops"] = args.parallel_loops
+    if args.async_jobs:
+        options["async_jobs"] = True
+    if args.runtime != "inline":
+        options["runtime"] = "import"
+    return options
+
+# write out each FILE's program as sheepy.py --client does
+def client_main(ap: argparse.ArgumentParser, args: argparse.Namespace,
+                options: dict) -> int:
+    if args.out_dir != None:
+        files = batch_files(args.file, args.out_dir)
+    elif len(args.file) == 1:
+        files = [(args.file[0], None)]
+    else:
+        ap.error("--client with more than one FILE requires --out-dir")
+    if args.runtime == "vendor":
+        if args.out_dir == None and args.output == None:
+            ap.error("--runtime vendor requires --output or --out-dir")
+        vendor_runtime([os.path.dirname(dst or args.output) for src, dst in files])
+    out = sys.stdout if args.output == None else open(args.output, "w")
+    try:
+        return run_client(args.client, files, options, out)
+    finally:
+        if out != sys.stdout:
+            out.close()
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(prog="sheepy_client.py",
+                                 description="translate FILEs through the "
+                                             "sheepy.py --serve daemon on SOCKET")
+    ap.add_argument("client", metavar="SOCKET")
+    ap.add_argument("file", metavar="FILE", nargs="+")
+    ap.add_argument("--out-dir", metavar="DIR",
+                    help="write a program for each FILE, and for every *.sh "
+                         "under a directory FILE, into DIR")
+    ap.add_argument("-o", "--output", metavar="OUT",
+                    help="write the Python program to OUT, not stdout")
+    ap.add_argument("--native-coreutils", action="store_true")
+    ap.add_argument("--parallel-loops", metavar="N", type=int, default=0)
+    ap.add_argument("--async", dest="async_jobs", action="store_true")
+    ap.add_argument("-O", dest="opt_level", metavar="LEVEL", type=int,
+                    choices=range(3), default=0)
+    ap.add_argument("--runtime", choices=["inline", "import", "vendor"],
+                    default="inline")
+    args = ap.parse_args(argv)
+    return client_main(ap, args, translation_options(args))
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
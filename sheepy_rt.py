@@ -0,0 +1,347 @@
+#!/usr/bin/python3
+# runtime support for programs translated by sheepy: imported by them with
+# --runtime import, or copied next to them with --runtime vendor; each
+# "# helper:" section is also the code --runtime inline pastes into a
+# program that uses it
+import asyncio
+import concurrent.futures
+import glob
+import locale
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+# helper: sh_pipeline
+# run the stages of a pipeline connected by OS pipes, a stage being an
+# argv list, an (argv, redirections) pair or a function returning the
+# output of a builtin; returns the exit status of the last stage
+def sh_pipeline(*stages, stdin=None, stdout=None):
+    procs = []
+    feeders = []
+    prev = stdin
+    for i, stage in enumerate(stages):
+        last = i == len(stages) - 1
+        if callable(stage):
+            # builtins do not read their input
+            sh_release(prev, stdin)
+            prev = None
+            if last:
+                sh_feed(stage, stdout or sys.stdout, False)
+            else:
+                r, w = os.pipe()
+                feeder = threading.Thread(target=sh_feed, args=(stage, os.fdopen(w, "w"), True))
+                feeder.start()
+                feeders.append(feeder)
+                prev = os.fdopen(r, "rb")
+            continue
+        argv, redirects = stage if isinstance(stage, tuple) else (stage, {})
+        streams = {"stdin": prev, "stdout": stdout if last else subprocess.PIPE}
+        streams.update(redirects)
+        proc = subprocess.Popen(argv, **streams)
+        sh_release(prev, stdin)
+        # output sent elsewhere leaves the next stage nothing to read
+        prev = proc.stdout if proc.stdout is not None else subprocess.DEVNULL
+        procs.append(proc)
+    for feeder in feeders:
+        feeder.join()
+    for proc in procs:
+        proc.wait()
+    if callable(stages[-1]):
+        return 0
+    return procs[-1].returncode
+
+# close the parent's end of a pipe once a stage has it
+def sh_release(f, stdin):
+    if f is not None and f is not stdin and hasattr(f, "close"):
+        f.close()
+
+def sh_feed(stage, f, close):
+    try:
+        for chunk in stage():
+            f.write(chunk)
+        f.flush()
+    except BrokenPipeError:
+        pass
+    finally:
+        if close:
+            try:
+                f.close()
+            except BrokenPipeError:
+                pass
+
+# helper: sh_parallel
+# run loop iterations, each a list of argv lists run in turn, on a pool of
+# threads; what each iteration printed is written in the loop's order,
+# through one pipe when stdout and stderr are the same file
+def sh_parallel(iterations, jobs):
+    merged = os.path.sameopenfile(1, 2)
+    def run(commands):
+        out = []
+        err = []
+        for args in commands:
+            p = subprocess.run(args, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT if merged else subprocess.PIPE)
+            out.append(p.stdout)
+            err.append(p.stderr or b"")
+        return (b"".join(out), b"".join(err))
+    sys.stdout.flush()
+    with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+        for out, err in pool.map(run, iterations):
+            sys.stdout.buffer.write(out)
+            sys.stdout.buffer.flush()
+            sys.stderr.buffer.write(err)
+            sys.stderr.buffer.flush()
+
+# helper: sh_jobs
+# background jobs by pid
+sh_jobs = {}
+
+def sh_spawn(args, **streams):
+    p = subprocess.Popen(args, **streams)
+    sh_jobs[p.pid] = p
+    sh_last[:] = [p.pid]
+
+# wait for the given jobs, or all of them; the status is the last one's,
+# 127 for a pid that is not a job
+def sh_wait(*pids):
+    status = 0
+    for pid in pids or list(sh_jobs):
+        p = sh_jobs.pop(int(pid), None) if str(pid).isdigit() else None
+        if p is None:
+            status = 127
+            continue
+        status = p.wait()
+        if status < 0:
+            status = 128 - status
+    return 0 if len(pids) == 0 else status
+
+# helper: sh_jobs_async
+# background jobs as asyncio subprocesses by pid; the event loop is made
+# by the first job and only runs while something waits on them
+sh_async_loop = []
+sh_async_jobs = {}
+
+def sh_async_run(aw):
+    if not sh_async_loop:
+        sh_async_loop.append(asyncio.new_event_loop())
+    return sh_async_loop[0].run_until_complete(aw)
+
+def sh_spawn_async(args, **streams):
+    proc = sh_async_run(asyncio.create_subprocess_exec(*args, **streams))
+    sh_async_jobs[proc.pid] = proc
+    sh_last[:] = [proc.pid]
+
+# wait for the given jobs, or all of them; the status is the last one's,
+# 127 for a pid that is not a job
+def sh_wait_async(*pids):
+    procs = []
+    status = 0
+    for pid in pids or list(sh_async_jobs):
+        proc = sh_async_jobs.pop(int(pid), None) if str(pid).isdigit() else None
+        if proc is None:
+            status = 127
+        procs.append(proc)
+    async def wait():
+        return await asyncio.gather(*(proc.wait() for proc in procs if proc is not None))
+    for status in sh_async_run(wait()):
+        if status < 0:
+            status = 128 - status
+    if len(pids) == 0:
+        return 0
+    return 127 if procs[-1] is None else status
+
+# helper: sh_last
+# the pid of the last background job started, for $!
+sh_last = []
+
+def sh_last_pid():
+    return str(sh_last[0]) if sh_last else ""
+
+# helper: sh_rm
+def sh_rm(paths, force=False):
+    status = 0
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            if not force:
+                print(f"rm: cannot remove '{path}': No such file or directory", file=sys.stderr)
+                status = 1
+        except OSError as e:
+            print(f"rm: cannot remove '{path}': {e.strerror}", file=sys.stderr)
+            status = 1
+    return status
+
+# helper: sh_mkdir
+def sh_mkdir(paths, parents=False):
+    status = 0
+    for path in paths:
+        try:
+            if parents:
+                os.makedirs(path, exist_ok=True)
+            else:
+                os.mkdir(path)
+        except OSError as e:
+            print(f"mkdir: cannot create directory '{path}': {e.strerror}", file=sys.stderr)
+            status = 1
+    return status
+
+# helper: sh_cat
+def sh_cat(paths):
+    status = 0
+    for path in paths or ["-"]:
+        try:
+            if path == "-":
+                shutil.copyfileobj(sys.stdin.buffer, sys.stdout.buffer)
+            else:
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, sys.stdout.buffer)
+        except OSError as e:
+            print(f"cat: {path}: {e.strerror}", file=sys.stderr)
+            status = 1
+    sys.stdout.buffer.flush()
+    return status
+
+# helper: sh_ls
+# ls without options, one name per line in collation order when the
+# output is not a terminal
+def sh_ls(paths):
+    if sys.stdout.isatty():
+        return subprocess.call(["ls"] + paths)
+    path = paths[0] if paths else "."
+    try:
+        if not os.path.isdir(path):
+            os.lstat(path)
+            print(path)
+            return 0
+        names = [name for name in os.listdir(path) if not name.startswith(".")]
+    except OSError as e:
+        print(f"ls: cannot access '{path}': {e.strerror}", file=sys.stderr)
+        return 2
+    try:
+        locale.setlocale(locale.LC_COLLATE, "")
+    except locale.Error:
+        pass
+    for name in sorted(names, key=locale.strxfrm):
+        print(name)
+    return 0
+
+# helper: sh_fgrep
+# fixed string search, each line of pattern being one string; exit status
+# 0 on a match, 1 on none and 2 on an unreadable file
+def sh_fgrep(pattern, paths, line=False, quiet=False):
+    patterns = [os.fsencode(p) for p in pattern.split("\n")]
+    matched = False
+    error = False
+    for path in paths or ["-"]:
+        try:
+            f = sys.stdin.buffer if path == "-" else open(path, "rb")
+        except OSError as e:
+            print(f"grep: {path}: {e.strerror}", file=sys.stderr)
+            error = True
+            continue
+        # stdin is left open for the commands after this one
+        try:
+            for text in f:
+                text = text.rstrip(b"\n")
+                if line:
+                    found = text in patterns
+                else:
+                    found = any(p in text for p in patterns)
+                if not found:
+                    continue
+                matched = True
+                if quiet:
+                    return 0
+                if len(paths) > 1:
+                    sys.stdout.buffer.write(os.fsencode(path) + b":")
+                sys.stdout.buffer.write(text + b"\n")
+        finally:
+            if path != "-":
+                f.close()
+    sys.stdout.buffer.flush()
+    if error:
+        return 2
+    return 0 if matched else 1
+
+# helper: sh_wc_l
+def sh_wc_l(path=None):
+    try:
+        f = sys.stdin.buffer if path is None else open(path, "rb")
+    except OSError as e:
+        print(f"wc: {path}: {e.strerror}", file=sys.stderr)
+        return 1
+    n = 0
+    while chunk := f.read(1 << 16):
+        n += chunk.count(b"\n")
+    if path is None:
+        print(n)
+    else:
+        f.close()
+        print(n, path)
+    return 0
+
+# helper: sh_glob
+# sorted expansion of a pattern
+def sh_glob(pattern):
+    return sorted(glob.glob(pattern))
+
+# helper: sh_test
+# the unary file tests of test(1)
+sh_tests = {
+    "-e": os.path.exists,
+    "-f": os.path.isfile,
+    "-d": os.path.isdir,
+    "-r": lambda path: os.access(path, os.R_OK),
+    "-w": lambda path: os.access(path, os.W_OK),
+    "-x": lambda path: os.access(path, os.X_OK),
+}
+
+def sh_test(op, path):
+    return sh_tests[op](path)
+
+# helper: sh_div
+# division and remainder of integers truncating toward zero, as the
+# shell's / and % do
+def sh_div(a, b):
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+def sh_mod(a, b):
+    return a - sh_div(a, b) * b
+
+# helper: sh_int_cmp
+# the integer comparisons of test(1); an operand that is not an integer is
+# reported as the shell does and makes the test false
+sh_int_cmps = {
+    "-eq": lambda a, b: a == b,
+    "-ne": lambda a, b: a != b,
+    "-gt": lambda a, b: a > b,
+    "-ge": lambda a, b: a >= b,
+    "-lt": lambda a, b: a < b,
+    "-le": lambda a, b: a <= b,
+}
+
+def sh_int_cmp(op, a, b):
+    for n in (a, b):
+        if isinstance(n, str):
+            digits = n.strip()
+            if not (digits[1:] if digits[:1] in ("-", "+") else digits).isdecimal():
+                print(f"[: Illegal number: {n}", file=sys.stderr)
+                return False
+    return sh_int_cmps[op](int(a), int(b))
+
+# helper: sh_call
+# run a command and wait for it, returning its exit status; one that
+# cannot be run is reported as the shell does
+def sh_call(args, **streams):
+    try:
+        return subprocess.call(args, **streams)
+    except FileNotFoundError:
+        print(f"{args[0]}: not found", file=sys.stderr)
+        return 127
+    except PermissionError:
+        print(f"{args[0]}: Permission denied", file=sys.stderr)
+        return 126
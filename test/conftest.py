@@ -0,0 +1,42 @@
+# helpers for the tests: translate a script, and run the program it
+# translates to in a scratch directory
+import os
+import subprocess
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+sys.path.insert(0, root)
+
+import sheepy
+
+sheepy_py = os.path.join(root, "sheepy.py")
+
+def translate(source: str, **options) -> str:
+    return sheepy.transpile(source, options)[0]
+
+def run_program(code: str, dir, args: list[str] = None, input: str = None) -> subprocess.CompletedProcess:
+    path = os.path.join(dir, "prog.py")
+    with open(path, "w") as f:
+        f.write(code)
+    env = dict(os.environ, PYTHONPATH=root)
+    return subprocess.run([sys.executable, "-u", path] + (args or []), cwd=dir, input=input,
+                          capture_output=True, text=True, env=env, timeout=60)
+
+# translate source and run it, returning its output
+def run_sh(source: str, dir, args: list[str] = None, input: str = None, **options) -> str:
+    p = run_program(translate(source, **options), dir, args, input)
+    assert p.returncode == 0, p.stderr
+    return p.stdout
+
+# run sheepy.py itself
+def sheepy_cli(args: list[str], dir, input: str = None, env: dict = None) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, sheepy_py] + args, cwd=dir, input=input,
+                          capture_output=True, text=True, env=dict(os.environ, **(env or {})),
+                          timeout=60)
+
+# run a program with nothing on PYTHONPATH
+def run_alone(args: list[str], dir) -> subprocess.CompletedProcess:
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONPATH"}
+    return subprocess.run([sys.executable] + args, cwd=dir, capture_output=True,
+                          text=True, env=env, timeout=60)
@@ -0,0 +1,34 @@
+# $(( )) and expr arithmetic, dividing as the shell does
+import pytest
+
+from conftest import run_sh, translate
+
+# division and remainder truncate toward zero, folded or not
+@pytest.mark.parametrize("a, b, q, r", [(7, 2, 3, 1), (-7, 2, -3, -1), (7, -2, -3, 1),
+                                        (-7, -2, 3, -1), (6, -3, -2, 0)])
+def test_division_signs(tmp_path, a, b, q, r):
+    source = f"#!/bin/dash\na={a}\nb={b}\necho $((a / b)) $((a % b)) `expr $a / $b` `expr $a % $b`\n"
+    assert run_sh(source, tmp_path) == f"{q} {r} {q} {r}\n"
+    folded = f"#!/bin/dash\necho $(( {a} / {b} )) $(( {a} % {b} ))\n"
+    assert "sh_div" not in translate(folded)
+    assert run_sh(folded, tmp_path) == f"{q} {r}\n"
+
+def test_division_runtime(tmp_path):
+    code = translate("#!/bin/dash\na=-7\necho $((3 * (a / 2))) $((-(a % 4)))\n", runtime="import")
+    assert "from sheepy_rt import" in code and "sh_div" in code and "sh_mod" in code
+    assert run_sh("#!/bin/dash\na=-7\necho $((3 * (a / 2))) $((-(a % 4)))\n", tmp_path,
+                  runtime="import") == "-9 3\n"
+
+def test_precedence(tmp_path):
+    source = "#!/bin/dash\nx=2\necho $((x + 3 * 4)) $(((x + 3) * 4)) $((x - (3 - 1))) `expr 7 '*' $x + 3`\n"
+    assert run_sh(source, tmp_path) == "14 20 0 17\n"
+
+def test_arguments(tmp_path):
+    assert run_sh("#!/bin/dash\necho $(($1 - $2)) $(($# * 2))\n", tmp_path, ["5", "-3"]) == "8 4\n"
+
+# only literals that print back unchanged are typed as integers
+def test_literal_typing(tmp_path):
+    source = "#!/bin/dash\nx=007\ny=-0\nz=5\necho $x $y $((z + 1))\n"
+    assert run_sh(source, tmp_path) == "007 -0 6\n"
+    code = translate(source)
+    assert "x = 7" not in code and "y = 0" not in code
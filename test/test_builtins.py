@@ -0,0 +1,23 @@
+# test and [ run in the program, reporting operands that are not integers
+import pytest
+
+from conftest import run_program, run_sh, translate
+
+@pytest.mark.parametrize("options", [{}, {"runtime": "import"}, {"opt_level": 2}])
+def test_illegal_number(tmp_path, options):
+    source = "#!/bin/dash\nif [ $1 -gt 0 ]\nthen\n    echo pos\nelse\n    echo no\nfi\n"
+    p = run_program(translate(source, **options), tmp_path, ["abc"])
+    assert (p.returncode, p.stdout, p.stderr) == (0, "no\n", "[: Illegal number: abc\n")
+    assert run_sh(source, tmp_path, [" 7 "], **options) == "pos\n"
+
+# as a command, [ is evaluated only to report its errors
+def test_statement(tmp_path):
+    source = "#!/bin/dash\n[ a -gt 1 ]\ntest 3 -gt 1\n[ -f nothing ]\necho done\n"
+    code = translate(source)
+    assert "subprocess" not in code
+    p = run_program(code, tmp_path)
+    assert (p.returncode, p.stdout, p.stderr) == (0, "done\n", "[: Illegal number: a\n")
+
+# a test that is not understood runs the command, [ and ] unglobbed
+def test_fallback_words(tmp_path):
+    assert "['[', 'a', '=', ']']" in translate("#!/bin/dash\n[ a = ]\n")
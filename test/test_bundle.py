@@ -0,0 +1,27 @@
+# --bundle: a zipapp of the precompiled programs of many scripts
+import os
+
+from conftest import run_alone, sheepy_cli
+
+def test_bundle(tmp_path):
+    (tmp_path / "d").mkdir()
+    (tmp_path / "d" / "hello.sh").write_text("#!/bin/dash\necho hello $1\nexit 4\n")
+    (tmp_path / "d" / "count.sh").write_text("#!/bin/dash\necho a b | wc -w\n")
+    for runtime in ("inline", "import"):
+        p = sheepy_cli(["--no-cache", "--runtime", runtime, "--bundle", "b.pyz", "d"], tmp_path)
+        assert p.returncode == 0, p.stderr
+        p = run_alone(["b.pyz", "hello", "x"], tmp_path)
+        assert p.returncode == 4 and p.stdout == "hello x\n"
+        assert run_alone(["b.pyz", "count"], tmp_path).stdout.strip() == "2"
+        # invoked through a link named after a script
+        os.symlink("b.pyz", tmp_path / "hello")
+        p = run_alone(["hello", "y"], tmp_path)
+        assert p.stdout == "hello y\n"
+        os.unlink(tmp_path / "hello")
+        p = run_alone(["b.pyz"], tmp_path)
+        assert p.returncode == 1 and "count hello" in p.stderr
+
+def test_bundle_bad_script(tmp_path):
+    (tmp_path / "bad.sh").write_text("#!/bin/dash\nfi\n")
+    p = sheepy_cli(["--no-cache", "--bundle", "b.pyz", "bad.sh"], tmp_path)
+    assert p.returncode != 0 and not (tmp_path / "b.pyz").exists()
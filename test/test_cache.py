@@ -0,0 +1,63 @@
+# the output cache: hits, misses, and a directory that cannot be written
+import os
+
+import sheepy
+from conftest import sheepy_cli
+
+source = b"#!/bin/dash\necho hi $1\n"
+
+def test_miss_then_hit(tmp_path):
+    cache = sheepy.Cache(str(tmp_path / "cache"))
+    code, ntoken, cached = cache.transpile(source)
+    assert not cached and ntoken > 0
+    again, ntoken, cached = cache.transpile(source)
+    assert cached and again == code
+    # other options are another entry
+    code, ntoken, cached = cache.transpile(source, {"opt_level": 1})
+    assert not cached
+
+def test_code_entry(tmp_path):
+    cache = sheepy.Cache(str(tmp_path / "cache"))
+    code = cache.compile(source, {}, "<test>")
+    assert cache.compile(source, {}, "<test>").co_code == code.co_code
+    names = os.listdir(tmp_path / "cache")
+    assert any(n.endswith(".code") for n in names) and any(n.endswith(".py") for n in names)
+    # the same script from another path gets its own filename
+    assert cache.compile(source, {}, "<other>").co_filename == "<other>"
+    assert cache.compile(source, {}, "<test>").co_filename == "<test>"
+
+def test_run_traceback(tmp_path):
+    for dir in ("a", "b"):
+        os.mkdir(tmp_path / dir)
+        (tmp_path / dir / "s.sh").write_bytes(b"#!/bin/dash\nx=$1\necho $((x + 1))\n")
+    env = {"SHEEPY_CACHE_DIR": str(tmp_path / "cache")}
+    for dir in ("a", "b"):
+        p = sheepy_cli(["--run", f"{dir}/s.sh", "nan"], tmp_path, env=env)
+        assert p.returncode != 0 and f"<translated {dir}/s.sh>" in p.stderr
+
+def test_eviction(tmp_path):
+    cache = sheepy.Cache(str(tmp_path / "cache"), max_bytes=1)
+    for i in range(3):
+        cache.transpile(source + b"echo %d\n" % i)
+    assert len(os.listdir(tmp_path / "cache")) <= 1
+
+def test_unwritable_dir(tmp_path):
+    (tmp_path / "h.sh").write_bytes(source)
+    env = {"SHEEPY_CACHE_DIR": "/proc/nope"}
+    p = sheepy_cli(["h.sh"], tmp_path, env=env)
+    assert p.returncode == 0 and "print('hi'" in p.stdout
+    assert p.stderr.count("not caching in /proc/nope") == 1
+    p = sheepy_cli(["--run", "h.sh", "x"], tmp_path, env=env)
+    assert p.returncode == 0 and p.stdout == "hi x\n"
+    assert p.stderr.count("not caching") == 1
+    p = sheepy_cli(["--batch", "--jobs", "2", "--out-dir", "out", "h.sh"], tmp_path, env=env)
+    assert p.returncode == 0 and (tmp_path / "out" / "h.py").exists()
+    assert p.stderr.count("not caching") == 1
+
+def test_cli_hit(tmp_path):
+    (tmp_path / "h.sh").write_bytes(source)
+    env = {"SHEEPY_CACHE_DIR": str(tmp_path / "cache")}
+    first = sheepy_cli(["h.sh"], tmp_path, env=env)
+    second = sheepy_cli(["h.sh"], tmp_path, env=env)
+    assert first.returncode == 0 and first.stdout == second.stdout
+    assert len(os.listdir(tmp_path / "cache")) == 1
@@ -0,0 +1,70 @@
+# the --serve daemon and its clients, sheepy.py --client and
+# sheepy_client.py
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from conftest import root, sheepy_cli
+
+client_py = os.path.join(root, "sheepy_client.py")
+
+def client(args: list[str], dir) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, client_py] + args, cwd=dir,
+                          capture_output=True, text=True, timeout=60)
+
+@pytest.fixture
+def server(tmp_path):
+    path = str(tmp_path / "s.sock")
+    p = subprocess.Popen([sys.executable, os.path.join(root, "sheepy.py"), "--no-cache",
+                          "--jobs", "1", "--serve", path])
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.05)
+    yield path
+    p.terminate()
+    p.wait()
+
+def test_client(tmp_path, server):
+    (tmp_path / "h.sh").write_text("#!/bin/dash\necho hi\n")
+    direct = sheepy_cli(["--no-cache", "-O1", "h.sh"], tmp_path).stdout
+    for p in (client([server, "-O1", "h.sh"], tmp_path),
+              sheepy_cli(["--client", server, "-O1", "h.sh"], tmp_path)):
+        assert p.returncode == 0 and p.stdout == direct
+
+def test_client_out_dir(tmp_path, server):
+    (tmp_path / "d").mkdir()
+    (tmp_path / "d" / "a.sh").write_text("#!/bin/dash\necho a\n")
+    (tmp_path / "d" / "bad.sh").write_text("#!/bin/dash\nfi\n")
+    p = client([server, "--out-dir", "out", "d"], tmp_path)
+    assert p.returncode == 1 and "bad.sh" in p.stderr
+    assert (tmp_path / "out" / "a.py").exists()
+
+def test_client_errors(tmp_path, server):
+    p = client([server, "missing.sh"], tmp_path)
+    assert p.returncode == 1 and "cannot open missing.sh" in p.stderr
+    for p in (client([str(tmp_path / "none.sock"), "missing.sh"], tmp_path),
+              sheepy_cli(["--client", str(tmp_path / "none.sock"), "missing.sh"], tmp_path)):
+        assert p.returncode == 1 and "cannot connect" in p.stderr
+        assert "Traceback" not in p.stderr
+
+# a daemon that goes away in the middle of a request
+def test_connection_closed(tmp_path):
+    path = str(tmp_path / "s.sock")
+    listener = socket.socket(socket.AF_UNIX)
+    listener.bind(path)
+    listener.listen()
+    def hang_up() -> None:
+        conn, addr = listener.accept()
+        conn.close()
+    threading.Thread(target=hang_up, daemon=True).start()
+    (tmp_path / "big.sh").write_text("#!/bin/dash\n" + "echo hi\n" * 200000)
+    p = client([path, "big.sh"], tmp_path)
+    listener.close()
+    assert p.returncode == 1 and "connection closed" in p.stderr
+    assert "Traceback" not in p.stderr
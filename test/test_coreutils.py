@@ -0,0 +1,43 @@
+# utilities run in the program with --native-coreutils
+from conftest import run_sh, translate
+
+def test_native_calls():
+    code = translate("#!/bin/dash\nrm -f a\nmkdir -p d\ncat a\nwc -l a\n", native_coreutils=True)
+    assert "sh_rm(" in code and "sh_mkdir(" in code and "sh_cat(" in code and "sh_wc_l(" in code
+    assert "subprocess.call" not in code
+
+# fgrep must leave stdin open for the commands after it
+def test_fgrep_stdin_then_cat(tmp_path):
+    source = """#!/bin/dash
+if fgrep -q abc
+then
+    echo found
+fi
+cat
+echo end
+"""
+    out = run_sh(source, tmp_path, input="abc\nxyz\n", native_coreutils=True)
+    assert out.startswith("found\n") and out.endswith("end\n")
+
+def test_fgrep_stdin_then_wc(tmp_path):
+    source = "#!/bin/dash\nfgrep x\nwc -l\necho end\n"
+    assert run_sh(source, tmp_path, input="x1\ny\nx2\n", native_coreutils=True) == "x1\nx2\n0\nend\n"
+
+def test_wc_cat_stdin(tmp_path):
+    assert run_sh("#!/bin/dash\nwc -l\n", tmp_path, input="a\nb\n", native_coreutils=True) == "2\n"
+    assert run_sh("#!/bin/dash\ncat\necho end\n", tmp_path, input="a\n", native_coreutils=True) == "a\nend\n"
+
+def test_files(tmp_path):
+    (tmp_path / "f").write_text("one\ntwo\n")
+    source = """#!/bin/dash
+mkdir -p d/e
+wc -l f
+fgrep -x two f
+rm f
+rm -f f
+cat f
+echo end
+"""
+    out = run_sh(source, tmp_path, native_coreutils=True)
+    assert out == "2 f\ntwo\nend\n"
+    assert (tmp_path / "d" / "e").is_dir()
@@ -0,0 +1,19 @@
+# test/testN.sh translates to test/testN.py exactly
+import os
+
+import pytest
+
+from conftest import here, translate
+
+def read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+@pytest.mark.parametrize("n", [0, 1, 2,
+    pytest.param(3, marks=pytest.mark.xfail(reason="a glob assigned to a variable "
+                                                   "is echoed as a list", strict=True)),
+    4])
+def test_golden(n):
+    source = read(os.path.join(here, f"test{n}.sh"))
+    # sheepy.py prints the program with a trailing newline
+    assert translate(source) + "\n" == read(os.path.join(here, f"test{n}.py"))
@@ -0,0 +1,62 @@
+# background jobs, wait and $!, and-or lists, and scripts that do not
+# parse
+import pytest
+
+import sheepy
+from conftest import run_sh, sheepy_cli, translate
+
+def test_background_and_wait(tmp_path):
+    out = run_sh("#!/bin/dash\necho one &\nsleep 0 &\npid=$!\nwait $pid\nwait\necho done\n", tmp_path)
+    assert out.splitlines() == ["one", "done"]
+
+def test_last_pid(tmp_path):
+    out = run_sh("#!/bin/dash\nsleep 0 &\necho $!\nwait\n", tmp_path)
+    assert out.strip().isdigit()
+
+def test_wait_unknown_pid(tmp_path):
+    out = run_sh("#!/bin/dash\nif wait 999999999\nthen\n    echo yes\nelse\n    echo no\nfi\n", tmp_path)
+    assert out == "no\n"
+
+def test_background_async(tmp_path):
+    out = run_sh("#!/bin/dash\necho one &\nwait $!\necho two\n", tmp_path, async_jobs=True)
+    assert out == "one\ntwo\n"
+
+def test_background_before_comment(tmp_path):
+    out = run_sh("#!/bin/dash\nsleep 0 & # nap\nwait\necho after\n", tmp_path)
+    assert out == "after\n"
+
+def test_and_or_lists(tmp_path):
+    source = """#!/bin/dash
+true && echo and
+false && echo not-and
+false || echo or
+true || echo not-or
+false && echo no || echo yes
+test -d . && test -d nonexistent || echo chained
+echo last
+"""
+    assert run_sh(source, tmp_path) == "and\nor\nyes\nchained\nlast\n"
+
+# && and || bind equally from the left, unlike and and or
+def test_and_or_condition(tmp_path):
+    source = "#!/bin/dash\nif true || false && false\nthen\n    echo yes\nelse\n    echo no\nfi\n"
+    assert run_sh(source, tmp_path) == "no\n"
+
+def test_and_or_tokens():
+    for engine in sheepy.lexer_engines:
+        token = sheepy.Lexer("#!/bin/dash\na&&b || c &\n", engine).tokenize()
+        kinds = [type(t).__name__ for t in token]
+        assert kinds == ["Word", "AndOr", "Word", "AndOr", "Word", "Amp", "Newline"]
+
+@pytest.mark.parametrize("line", ["sleep 1 & echo two", "echo a | cat &", "x=1 &",
+                                  "true && echo and &", "fi"])
+def test_parse_error(tmp_path, line):
+    source = f"#!/bin/dash\necho before\n{line}\necho after\n"
+    with pytest.raises(sheepy.ParseError):
+        translate(source)
+    (tmp_path / "bad.sh").write_text(source)
+    for extra in ([], ["--stream"]):
+        p = sheepy_cli(["--no-cache"] + extra + ["bad.sh"], tmp_path)
+        assert p.returncode == 2
+        assert "bad.sh: line 3: syntax error" in p.stderr
+        assert "Traceback" not in p.stderr
@@ -0,0 +1,58 @@
+# the cursor, legacy and streaming lexers agree, and --stream writes what
+# a whole translation does
+import glob
+import io
+import os
+
+import pytest
+
+import sheepy
+from conftest import root
+
+scripts = sorted(glob.glob(os.path.join(root, "examples", "*", "*.sh"))
+                 + glob.glob(os.path.join(root, "test", "*.sh")))
+
+def kinds(token: list) -> list[tuple[str, str]]:
+    return [(type(t).__name__, t.src[t.start:t.end]) for t in token]
+
+def read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+@pytest.mark.parametrize("path", scripts, ids=os.path.basename)
+def test_engines_agree(path):
+    assert sheepy.Lexer.compare(read(path)) == -1
+
+# token boundaries do not depend on where the chunks of a stream end
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_stream_chunks(chunk_size):
+    for path in scripts:
+        source = read(path)
+        whole = sheepy.Lexer(source).tokenize()
+        streamed = list(sheepy.Lexer.stream(io.StringIO(source), chunk_size))
+        assert kinds(streamed) == kinds(whole), path
+
+def test_tokens():
+    token = sheepy.Lexer("#!/bin/dash\nx=1 # c\necho 'a b' \"$x\" >out\n").tokenize()
+    assert [type(t).__name__ for t in token] == \
+        ["Assign", "Comment", "Newline", "Word", "SQuote", "DQuote", "Redirect",
+         "Word", "Newline"]
+
+# sheepy.py's output, run in this process
+def cli(capsys, args: list[str]) -> str:
+    assert sheepy.main(["--no-cache"] + args) == 0
+    return capsys.readouterr().out
+
+def test_stream_output(capsys):
+    for path in scripts:
+        for extra in ([], ["-O2"], ["--native-coreutils"]):
+            assert cli(capsys, ["--stream"] + extra + [path]) == cli(capsys, extra + [path]), \
+                (path, extra)
+
+# a variable only found to be a string near the end types its earlier uses
+def test_stream_types(tmp_path, capsys):
+    path = str(tmp_path / "t.sh")
+    with open(path, "w") as f:
+        f.write("#!/bin/dash\nx=1\necho $((x + 1))\nx=a\necho $x\n")
+    streamed = cli(capsys, ["--stream", path])
+    assert streamed == cli(capsys, [path]) and "int(x)" in streamed
@@ -0,0 +1,31 @@
+# parsing: nesting as deep as the parser before memoization could take,
+# and the memo giving the same tree as parsing without it
+import pytest
+
+import sheepy
+from conftest import translate
+
+blocks = {
+    "while": ("while test a = a\ndo\n", "done\n"),
+    "for": ("for i in a\ndo\n", "done\n"),
+    "if": ("if test a = a\nthen\n", "fi\n"),
+}
+
+@pytest.mark.parametrize("kind", blocks)
+def test_deep_nesting(kind):
+    head, tail = blocks[kind]
+    code = translate("#!/bin/dash\n" + head * 300 + "echo x\n" + tail * 300)
+    assert " " * 4 * 300 + "print('x')" in code
+
+def test_deep_mixed():
+    source = "#!/bin/dash\n" + "".join(blocks[k][0] for k in blocks) * 100 + "echo x\n" \
+        + "".join(blocks[k][1] for k in reversed(blocks)) * 100
+    assert "print('x')" in translate(source)
+
+def test_memo_same_tree():
+    with open(sheepy.__file__.replace("sheepy.py", "examples/4/series.sh")) as f:
+        source = f.read()
+    token = sheepy.Lexer(source).tokenize()
+    memo = sheepy.Translator(sheepy.Parser(token).parse()).translate()
+    plain = sheepy.Translator(sheepy.Parser(token, memoize=False).parse()).translate()
+    assert memo == plain
@@ -0,0 +1,39 @@
+# pipelines of processes joined by OS pipes
+from conftest import run_sh, translate
+
+def test_pipeline(tmp_path):
+    (tmp_path / "in").write_text("b\na\nc\n")
+    source = """#!/bin/dash
+sort < in | head -n 2
+echo one two | tr a-z A-Z
+cat in | sort | tail -n 1 > last
+cat last
+"""
+    assert "sh_pipeline(" in translate(source)
+    assert run_sh(source, tmp_path) == "a\nb\nONE TWO\nc\n"
+
+# the status of a pipeline is that of its last stage
+def test_pipeline_status(tmp_path):
+    source = """#!/bin/dash
+if echo abc | grep -q b
+then
+    echo matched
+fi
+if true | false
+then
+    echo wrong
+fi
+if false | true
+then
+    echo last
+fi
+"""
+    assert run_sh(source, tmp_path) == "matched\nlast\n"
+
+def test_pipeline_runtime_import(tmp_path):
+    source = "#!/bin/dash\necho x y | wc -w\n"
+    assert "from sheepy_rt import" in translate(source, runtime="import")
+    assert run_sh(source, tmp_path, runtime="import").strip() == "2"
+
+def test_pipeline_stdin(tmp_path):
+    assert run_sh("#!/bin/dash\nsort | head -n 1\n", tmp_path, input="z\ny\n") == "y\n"
@@ -0,0 +1,37 @@
+# while read loops, over stdin and over a redirected file
+from conftest import run_sh, translate
+
+def test_read_loop(tmp_path):
+    source = "#!/bin/dash\nwhile read line\ndo\n    echo x${line}x\ndone\necho end x${line}x\n"
+    assert run_sh(source, tmp_path, input="a\n  b  \n") == "xax\nxbx\nend xx\n"
+
+# the last line without a newline ends the loop but is still read
+def test_partial_last_line(tmp_path):
+    source = "#!/bin/dash\nwhile read line\ndo\n    echo x${line}x\ndone\necho end x${line}x\n"
+    assert run_sh(source, tmp_path, input="a\n  b  ") == "xax\nend xbx\n"
+
+def test_partial_last_line_readline(tmp_path):
+    source = """#!/bin/dash
+n=0
+while read line
+do
+    n=$((n + 1))
+    ls nonexistent 2>/dev/null
+done
+echo x${line}x $n
+"""
+    code = translate(source)
+    assert ".readline()" in code
+    assert run_sh(source, tmp_path, input="a\n  b  ") == "xbx 1\n"
+
+# a variable read assigns is a string, whatever else is assigned to it
+def test_read_var_is_string(tmp_path):
+    source = "#!/bin/dash\nx=5\nwhile read x\ndo\n    echo $x\ndone\n"
+    code = translate(source, opt_level=2)
+    assert 'x = f"5"' in code
+    assert run_sh(source, tmp_path, input="07\n", opt_level=2) == "07\n"
+
+def test_read_from_file(tmp_path):
+    (tmp_path / "in").write_text("one\ntwo\n")
+    source = "#!/bin/dash\nwhile read w\ndo\n    echo $w\ndone < in\n"
+    assert run_sh(source, tmp_path) == "one\ntwo\n"
@@ -0,0 +1,29 @@
+# redirections, and append targets kept open across a loop
+from conftest import run_sh, translate
+
+def test_redirects(tmp_path):
+    source = """#!/bin/dash
+echo hi > out
+echo ho >> out
+cat < out
+ls nonexistent 2> err
+wc -l < err
+echo hi | cat >> out
+cat out
+"""
+    assert run_sh(source, tmp_path) == "hi\nho\n1\nhi\nho\nhi\n"
+
+def test_loop_append(tmp_path):
+    source = """#!/bin/dash
+for i in 1 2 3
+do
+    echo $i >> loop
+    cat loop
+done
+"""
+    assert run_sh(source, tmp_path) == "1\n1\n2\n1\n2\n3\n"
+    assert (tmp_path / "loop").read_text() == "1\n2\n3\n"
+
+def test_redirect_target_word(tmp_path):
+    source = "#!/bin/dash\nf=name\necho a > $f.txt\ncat $f.txt\n"
+    assert run_sh(source, tmp_path) == "a\n"
@@ -0,0 +1,18 @@
+# --run: translating a script and running it in sheepy.py's process
+import os
+
+from conftest import sheepy_cli
+
+def test_run(tmp_path):
+    (tmp_path / "s.sh").write_text("#!/bin/dash\necho $# $1\nread line\necho got $line\nexit 3\n")
+    env = {"SHEEPY_CACHE_DIR": str(tmp_path / "cache")}
+    for _ in range(2): # a miss, then the cached code object
+        p = sheepy_cli(["--run", "s.sh", "a", "b"], tmp_path, input="x y\n", env=env)
+        assert p.returncode == 3 and p.stdout == "2 a\ngot x y\n"
+    assert any(n.endswith(".code") for n in os.listdir(tmp_path / "cache"))
+
+def test_run_missing(tmp_path):
+    for script in ("missing.sh", "."):
+        p = sheepy_cli(["--no-cache", "--run", script], tmp_path)
+        assert p.returncode == 127
+        assert p.stderr == f"sheepy.py: cannot open {script}\n"
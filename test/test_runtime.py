@@ -0,0 +1,33 @@
+# the helpers defined in each program, imported from sheepy_rt, or
+# imported from a copy of it next to the program
+import sheepy
+from conftest import run_alone, run_sh, sheepy_cli, translate
+
+source = "#!/bin/dash\nfor f in *.txt\ndo\n    echo $f\ndone\nsleep 0 &\nwait\necho a b | wc -w\n"
+
+def test_inline_and_import(tmp_path):
+    (tmp_path / "a.txt").write_text("")
+    inline = translate(source)
+    assert "def sh_pipeline(" in inline and "sheepy_rt" not in inline
+    imported = translate(source, runtime="import")
+    assert "def sh_" not in imported
+    assert "from sheepy_rt import" in imported and "sh_pipeline" in imported
+    expected = "a.txt\n2\n"
+    assert run_sh(source, tmp_path).replace(" ", "") == expected
+    assert run_sh(source, tmp_path, runtime="import").replace(" ", "") == expected
+
+# inlined helpers are the module's sections, so both run the same code
+def test_helpers_match_module():
+    with open(sheepy.runtime_path()) as f:
+        module = f.read()
+    for name, code in sheepy.runtime_helpers.items():
+        assert code.strip() in module
+        assert sheepy.runtime_names(name)
+
+def test_vendor(tmp_path):
+    (tmp_path / "s.sh").write_text(source)
+    p = sheepy_cli(["--no-cache", "--runtime", "vendor", "-o", "out/s.py", "s.sh"], tmp_path)
+    assert p.returncode == 0
+    assert (tmp_path / "out" / "sheepy_rt.py").exists()
+    p = run_alone(["out/s.py"], tmp_path)
+    assert p.returncode == 0, p.stderr
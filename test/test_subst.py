@@ -0,0 +1,35 @@
+# command substitution of pure commands, folded or inlined
+from conftest import run_sh, translate
+
+def test_fold_literal():
+    code = translate("#!/bin/dash\nb=`basename /a/b.c .c`\nd=$(dirname /a/b/)\n")
+    assert "'b'" in code and "'/a'" in code
+    assert "subprocess" not in code
+
+def test_basename_in_test(tmp_path):
+    source = """#!/bin/dash
+f=/x/foo
+if test `basename $f` = bar
+then
+    echo same
+else
+    echo differ
+fi
+"""
+    assert run_sh(source, tmp_path) == "differ\n"
+
+def test_dirname_in_test(tmp_path):
+    source = """#!/bin/dash
+f=/x/foo
+if [ $(dirname $f) = /y ]
+then
+    echo same
+else
+    echo differ
+fi
+"""
+    assert run_sh(source, tmp_path) == "differ\n"
+
+def test_inline_values(tmp_path):
+    source = "#!/bin/dash\nfor f in /a/b/ c / d/e\ndo\n    echo `basename $f` `dirname $f`\ndone\n"
+    assert run_sh(source, tmp_path) == "b /a\nc .\n/ /\ne d\n"